@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import typing
+import uuid
+import zipfile
+
+# the single file a compressed item directory holds
+ARCHIVE_NAME = ".cacher.zip"
+# member recording the exact mtimes, zip only keeps them to two seconds
+_MTIMES = ".cacher-mtimes.json"
+
+
+def is_packed(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, ARCHIVE_NAME))
+
+
+def pack(path: str, level: int = 6):
+    """
+    replaces the files under `path` by a single deflated zip archive
+    """
+    archive = os.path.join(path, ARCHIVE_NAME)
+    mtimes = {}
+    with zipfile.ZipFile(
+        archive + ".tmp", "w", zipfile.ZIP_DEFLATED, compresslevel=level
+    ) as zf:
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                file = os.path.join(dirpath, name)
+                rel = os.path.relpath(file, path).replace(os.sep, "/")
+                if rel in (ARCHIVE_NAME, ARCHIVE_NAME + ".tmp"):
+                    continue
+                zf.write(file, rel)
+                mtimes[rel] = os.stat(file).st_mtime_ns
+        zf.writestr(_MTIMES, json.dumps(mtimes))
+    os.replace(archive + ".tmp", archive)
+
+    for name in os.listdir(path):
+        if name == ARCHIVE_NAME:
+            continue
+        full = os.path.join(path, name)
+        if os.path.isdir(full) and not os.path.islink(full):
+            shutil.rmtree(full)
+        else:
+            os.remove(full)
+
+
+class Archive:
+    """
+    read access to the members of a packed item without unpacking it
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.zf = zipfile.ZipFile(path)
+        try:
+            self.mtimes: typing.Dict[str, int] = json.loads(self.zf.read(_MTIMES))
+        except KeyError:
+            self.mtimes = {}
+
+    def names(self) -> typing.List[str]:
+        return [name for name in self.zf.namelist() if name != _MTIMES]
+
+    def info(self, name: str) -> zipfile.ZipInfo:
+        return self.zf.getinfo(name)
+
+    def open(self, name: str) -> typing.IO[bytes]:
+        """
+        seekable stream of a member, only the requested ranges are inflated
+        """
+        return self.zf.open(name)
+
+    def extract(self, name: str, root: str) -> str:
+        """
+        writes member `name` under `root`, returns its path
+        """
+        target = os.path.join(root, *name.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        with self.zf.open(name) as src, open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        if name in self.mtimes:
+            os.utime(tmp, ns=(self.mtimes[name], self.mtimes[name]))
+        os.replace(tmp, target)
+        return target
+
+    def close(self):
+        self.zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,174 @@
+import json
+import os
+import shutil
+import typing
+import uuid
+
+from .locks import FileLock
+from .utils import clone_file, dump_json_atomic, hash_file
+
+BLOB_MODES = ["hardlink", "reflink", "symlink"]
+
+
+class BlobStore:
+    """
+    content-addressed storage shared by all cache items
+
+    files of an item are moved into `<root>/objects/<ab>/<digest>` and the item
+    directory is materialized as hardlinks, reflinks or symlinks to them.
+    `refs.json` records which blobs every generation of an item uses, so a
+    blob is only deleted once no kept generation references it anymore. every
+    change holds a file lock and starts from the refs on disk, so processes do
+    not drop each other's refs
+    """
+
+    def __init__(self, root: str, mode: typing.Optional[str] = None):
+        assert mode is None or mode in BLOB_MODES, f"invalid blob mode: {mode}"
+        self.root = root
+        self.mode = mode
+        self.refsPath = os.path.join(root, "refs.json")
+        self.fileLock = FileLock(self.refsPath + ".lock")
+        # id -> generation -> relative path -> digest
+        self.items: typing.Dict[str, typing.Dict[str, typing.Dict[str, str]]] = {}
+        self.counts: typing.Dict[str, int] = {}
+        self._load()
+
+    def _load(self):
+        """
+        reads the refs of every item from disk and recounts the blobs
+        """
+        try:
+            with open(self.refsPath, "r", encoding="utf-8") as f:
+                self.items = json.load(f)
+        except (OSError, ValueError):
+            self.items = {}
+        self.counts = {}
+        for id, generations in self.items.items():
+            if any(isinstance(v, str) for v in generations.values()):
+                # refs from before generations, of the directory that
+                # becomes generation 0 on the next publish
+                generations = self.items[id] = {"0": generations}
+            for files in generations.values():
+                for digest in files.values():
+                    self.counts[digest] = self.counts.get(digest, 0) + 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode is not None
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def _save(self):
+        dump_json_atomic(self.refsPath, self.items)
+
+    def _store(self, file: str, blob: str) -> bool:
+        """
+        adds `file` to the store, returns True if `file` itself became the blob
+        """
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if self.mode == "hardlink":
+            try:
+                os.link(file, blob)
+                return True
+            except FileExistsError:
+                return False
+            except OSError:
+                pass
+        tmp = f"{blob}.{uuid.uuid4().hex}.tmp"
+        clone_file(file, tmp)
+        os.replace(tmp, blob)
+        return False
+
+    def _materialize(self, blob: str, dst: str):
+        tmp = dst + ".blob-tmp"
+        if self.mode == "hardlink":
+            try:
+                os.link(blob, tmp)
+            except OSError:
+                clone_file(blob, tmp)
+        elif self.mode == "symlink":
+            os.symlink(blob, tmp)
+        else:
+            clone_file(blob, tmp)
+        os.replace(tmp, dst)
+
+    def ingest(self, id: str, path: str, generation: int = 0):
+        """
+        moves every regular file under `path`, the tree of `generation` of
+        `id`, into the store and replaces it with a link to its blob. the file
+        lock is held throughout, so no other process deletes a blob between
+        linking and recording it
+        """
+        with self.fileLock:
+            self._load()
+            files = {}
+            for dirpath, dirnames, filenames in os.walk(path):
+                for name in filenames:
+                    file = os.path.join(dirpath, name)
+                    if name.startswith(".part-") or os.path.islink(file):
+                        continue
+                    digest = hash_file(file)
+                    blob = self.blob_path(digest)
+                    files[os.path.relpath(file, path)] = digest
+
+                    if not os.path.exists(blob) and self._store(file, blob):
+                        continue
+                    if not os.path.samefile(file, blob):
+                        self._materialize(blob, file)
+
+            # files seeded as symlinks into the store keep their blob
+            for previous in self.items.get(id, {}).values():
+                for rel, digest in previous.items():
+                    file = os.path.join(path, rel)
+                    if rel not in files and os.path.islink(file):
+                        if os.path.realpath(file) == os.path.realpath(self.blob_path(digest)):
+                            files[rel] = digest
+
+            self._update(id, str(generation), files)
+
+    def release(self, id: str, generation: typing.Optional[int] = None):
+        """
+        drops the refs of `generation` of `id`, of all its generations by default
+        """
+        with self.fileLock:
+            self._load()
+            if generation is not None:
+                self._update(id, str(generation), {})
+                return
+            for name in list(self.items.get(id, {})):
+                self._update(id, name, {})
+
+    def _update(self, id: str, generation: str, files: typing.Dict[str, str]):
+        """
+        replaces the refs of `generation` of `id`, the caller holds the file
+        lock and loaded the refs from disk
+        """
+        generations = self.items.setdefault(id, {})
+        old = generations.pop(generation, {})
+        if files:
+            generations[generation] = files
+        if not generations:
+            del self.items[id]
+        for digest in files.values():
+            self.counts[digest] = self.counts.get(digest, 0) + 1
+        for digest in old.values():
+            self.counts[digest] -= 1
+            if self.counts[digest] <= 0:
+                del self.counts[digest]
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+        if files or old:
+            self._save()
+
+    def clear(self):
+        with self.fileLock:
+            shutil.rmtree(os.path.join(self.root, "objects"), ignore_errors=True)
+            try:
+                os.remove(self.refsPath)
+            except FileNotFoundError:
+                pass
+            self.items = {}
+            self.counts = {}
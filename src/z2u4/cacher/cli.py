@@ -1,7 +1,11 @@
+import json
 import os
-import shutil
 import click
+from z2u4.cacher.blobs import BLOB_MODES
 from z2u4.cacher.core import TYPES, CacheItemParams, Cacher
+from z2u4.cacher.eviction import EVICTION_POLICIES
+from z2u4.cacher.store import BACKENDS
+from z2u4.cacher.utils import parse_size
 
 
 def processCliParams(args: list[str]) -> dict:
@@ -35,10 +39,13 @@ def _list(cachetype):
     processed = []
     for id, item in items:
         signature = item["meta"].get("url", None)
+        size = "evicted" if item.get("evicted") else item.get("size")
 
-        processed.append([id, item["type"], signature])
+        processed.append([id, item["type"], signature, size, item.get("hits", 0)])
 
-    click.echo(tabulate(processed, headers=["ID", "Type", "Signature"]))
+    click.echo(
+        tabulate(processed, headers=["ID", "Type", "Signature", "Size", "Hits"])
+    )
 
 
 @cli.command("remove")
@@ -59,7 +66,13 @@ def purge(force):
         Cacher.purge()
         click.echo("Cache purged", color="red")
     else:
-        directories = os.listdir(Cacher.CACHE_DIR)
+        Cacher.open()
+        directories = [
+            name for name in os.listdir(Cacher.CACHE_DIR) if not name.startswith(".")
+        ]
+        gens = os.path.join(Cacher.CACHE_DIR, ".gens")
+        if os.path.isdir(gens):
+            directories += [name for name in os.listdir(gens) if name not in directories]
         for id, _ in Cacher.iter_cache():
             if id in directories:
                 directories.remove(id)
@@ -68,9 +81,7 @@ def purge(force):
             click.echo(f"The following directories will be purged: {directories}")
             if click.confirm("Are you sure you want to proceed?"):
                 for id in directories:
-                    shutil.rmtree(
-                        os.path.join(Cacher.CACHE_DIR, id), ignore_errors=True
-                    )
+                    Cacher.GENERATIONS.delete(id)
                 click.echo("Cache purged", color="red")
             else:
                 click.echo("Cache not purged", color="red")
@@ -102,7 +113,36 @@ def cache(cachetype, args):
 @click.option("-c", "--cacheType", type=click.Choice(TYPES))
 @click.option("-a", "--args", type=str, multiple=True)
 @click.option("-f", "--force", is_flag=True)
-def check(id, cachetype, args, force):
+@click.option("--all", "all_", is_flag=True, help="check every cached item")
+@click.option("-w", "--workers", type=int, default=8, show_default=True)
+@click.option("--per-host", "perhost", type=int, default=2, show_default=True)
+def check(id, cachetype, args, force, all_, workers, perhost):
+    if all_:
+        import time
+        from tabulate import tabulate
+
+        start = time.perf_counter()
+        results = Cacher.check_all(force=force, workers=workers, perHost=perhost)
+        elapsed = time.perf_counter() - start
+        rows = [
+            [r["id"], r["type"], r["status"], f"{r['seconds']:.2f}s", r.get("error", "")]
+            for r in results
+            if r["status"] != "skipped"
+        ]
+        if rows:
+            click.echo(
+                tabulate(rows, headers=["ID", "Type", "Status", "Time", "Error"])
+            )
+        counts = {
+            status: sum(1 for r in results if r["status"] == status)
+            for status in ("renewed", "skipped", "failed")
+        }
+        click.echo(
+            f"renewed: {counts['renewed']}, skipped: {counts['skipped']}, "
+            f"failed: {counts['failed']} in {elapsed:.2f}s"
+        )
+        return
+
     if args:
         params = processCliParams(args)
         id = Cacher.cache(cachetype, **params)
@@ -116,16 +156,169 @@ def check(id, cachetype, args, force):
 @click.option("--id", type=str)
 @click.option("-c", "--cacheType", type=click.Choice(TYPES))
 @click.option("-a", "--args", type=str, multiple=True)
-def fpath(path, id, cachetype, args):
-    if id or args:
-        if args:
-            assert cachetype, "cache type is required"
-            params = processCliParams(args)
-            id = Cacher.cache(cachetype, **params)
-        else:
-            assert id, "id is required"
-    else:
+@click.option("-q", "--query", type=str, help="id, type/value or meta value of the item")
+def fpath(path, id, cachetype, args, query):
+    """print the files of an item matching a path, glob or basename"""
+    if args:
+        assert cachetype, "cache type is required"
+        params = processCliParams(args)
+        id = Cacher.cache(cachetype, **params)
+    query = id or query
+    assert query, "one of --id, --query or --args is required"
+
+    paths = Cacher.resolve(query, path)
+    if not paths:
+        raise click.ClickException(f"No file matching {path} in {query}")
+    for p in paths:
+        click.echo(p)
+
+
+@cli.command()
+@click.option("--lead", type=float, default=300, show_default=True, help="seconds before expiry to renew")
+@click.option("--jitter", type=float, default=60, show_default=True)
+@click.option("-w", "--workers", type=int, default=4, show_default=True)
+@click.option("--rescan", type=float, default=60, show_default=True)
+@click.option("--once", is_flag=True, help="renew what is due now and exit")
+@click.option("--status", is_flag=True, help="show the queue of the running daemon")
+def daemon(lead, jitter, workers, rescan, once, status):
+    import datetime
+    from tabulate import tabulate
+    from z2u4.cacher.scheduler import RefreshScheduler, load_state
+
+    statePath = os.path.join(Cacher.USRPATH, "scheduler.json")
+    if status:
+        state = load_state(statePath)
+        if not state:
+            click.echo("No scheduler state found")
+            return
+        fts = lambda x: datetime.datetime.fromtimestamp(x).strftime("%Y-%m-%d %H:%M:%S")  # noqa
+        click.echo(f"pid {state['pid']}, updated {fts(state['updated'])}")
+        rows = [
+            [
+                row["id"],
+                "running" if row["running"] else "queued",
+                fts(row["running"] or row["due"]),
+                row.get("error") or "",
+            ]
+            for row in state["queue"]
+        ]
+        click.echo(tabulate(rows, headers=["ID", "State", "Since / Due", "Last Error"]))
+        return
+
+    scheduler = RefreshScheduler(
+        lead=lead,
+        jitter=jitter,
+        workers=workers,
+        rescan=rescan,
+        statePath=statePath,
+    )
+    try:
+        scheduler.run(once=once)
+    except KeyboardInterrupt:
+        click.echo("Scheduler stopped")
+
+
+@cli.command()
+@click.argument("key", required=False)
+@click.argument("value", required=False)
+@click.option("-u", "--unset", is_flag=True)
+def config(key, value, unset):
+    if not key:
+        for k, v in Cacher.CONFIG.items():
+            click.echo(f"{k}\t{v}")
+        return
+
+    if unset:
+        Cacher.CONFIG.pop(key, None)
+        return
+
+    if value is None:
+        click.echo(Cacher.CONFIG.get(key))
+        return
+
+    try:
+        value = json.loads(value)
+    except ValueError:
         pass
+    if key == "blobs":
+        assert value in BLOB_MODES, f"blobs must be one of {BLOB_MODES}"
+    if key == "backend":
+        assert value in BACKENDS, f"backend must be one of {BACKENDS}"
+    if key == "quota":
+        parse_size(value)
+    if key == "compress":
+        assert isinstance(value, bool), "compress must be true or false"
+    if key == "eviction":
+        assert value in EVICTION_POLICIES, f"eviction must be one of {EVICTION_POLICIES}"
+    Cacher.CONFIG[key] = value
+
+
+@cli.command()
+@click.argument("id", type=str)
+@click.option("-g", "--generation", type=int, help="defaults to the previous one")
+def rollback(id, generation):
+    """switch an item back to a previous generation"""
+    generation = Cacher.rollback(id, generation)
+    click.echo(f"Item {id} is at generation {generation}")
+
+
+@cli.command()
+@click.option("-n", "--dry-run", "dryrun", is_flag=True)
+def evict(dryrun):
+    """evict items until the cache fits in the configured quota"""
+    if Cacher.CONFIG.get("quota") is None:
+        click.echo("No quota configured, set one with `config quota 10G`")
+        return
+    for id in Cacher.evict(dryRun=dryrun):
+        click.echo(f"{'Would evict' if dryrun else 'Evicted'} {id}")
+
+
+@cli.command()
+@click.argument("id", type=str)
+@click.option("-u", "--unset", is_flag=True)
+def pin(id, unset):
+    """exclude an item from eviction"""
+    item = Cacher.CACHE[id]
+    if unset:
+        item.pop("pinned", None)
+    else:
+        item["pinned"] = True
+    Cacher.CACHE.save(id)
+
+
+@cli.command()
+@click.argument("id", type=str)
+@click.option("-d", "--disable", is_flag=True, help="store the files as is")
+@click.option("-u", "--unset", is_flag=True, help="follow the compress config")
+def compress(id, disable, unset):
+    """keep an item as a single zip archive"""
+    Cacher.set_compressed(id, None if unset else not disable)
+
+
+@cli.command()
+@click.option("--id", "ids", type=str, multiple=True)
+@click.option("--all", "all_", is_flag=True, help="verify every cached item")
+@click.option("-w", "--workers", type=int, help="hashing processes, one per cpu by default")
+@click.option("-r", "--repair", is_flag=True, help="fetch broken items again")
+def verify(ids, all_, workers, repair):
+    """compare cached files against the digests recorded at renewal"""
+    from tabulate import tabulate
+
+    assert ids or all_, "one of --id or --all is required"
+    reports = Cacher.verify(None if all_ else ids, workers=workers, repair=repair)
+    rows = [
+        [id, kind, path]
+        for id, report in reports.items()
+        for kind in ("missing", "extra", "modified")
+        for path in report[kind]
+    ]
+    if rows:
+        click.echo(tabulate(rows, headers=["ID", "Problem", "Path"]))
+    broken = sum(1 for report in reports.values() if any(report.values()))
+    click.echo(
+        f"verified: {len(reports)}, broken: {broken}"
+        + (", repaired" if repair and broken else "")
+    )
 
 
 @cli.command()
@@ -1,21 +1,43 @@
 import datetime
+import json
 import logging
 import os
-import pprint
+import re
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import TypedDict
 import typing
 import uuid
-from zuu.STRUCT.dict_with_autosave import DictWithAutosave
+import weakref
+from .blobs import BlobStore
+from . import archive, git, github
+from .download import (
+    CHUNK_SIZE,
+    Validators,
+    adownload,
+    download,
+    download_segmented,
+)
+from .transport import Transport
+from .eviction import select_evictions
+from .generations import Generations
+from .locks import FileLock
+from .manifest import Manifest, Manifests, build_manifest, match
+from .store import JsonDict, MetaStore, open_store
+from .sync import matches_manifest, sync_tree
+from .verify import VerifyReport, verify_trees
 from .utils import (
     convert_url_to_raw,
     extract_githubrelease_params,
-    extract_githuburl_params,
     extract_raw_params,
+    get_item_host,
+    parse_size,
+    tree_size,
 )
 
 USRPATH = os.path.join(os.path.expanduser("~"), ".z2u4", "cacher")
-os.makedirs(USRPATH, exist_ok=True)
 
 TYPES = [
     "githubGist",
@@ -34,6 +56,9 @@ TYPE_LITERAL = typing.Literal[
     "gitRepo",
 ]
 
+# types stored in the blob store when enabled, git keeps its own object store
+BLOB_TYPES = [t for t in TYPES if t != "gitRepo"]
+
 
 class CacheItemParams(TypedDict, total=False):
     # repo
@@ -45,6 +70,9 @@ class CacheItemParams(TypedDict, total=False):
 
     # repo
     branch: str
+    # git clone depth (0 for full history) and sparse checkout paths
+    depth: int
+    sparse: typing.List[str]
 
     # github file | local target
     path: str
@@ -52,6 +80,9 @@ class CacheItemParams(TypedDict, total=False):
     # gist
     id: str
 
+    # web target
+    checksum: str
+
     # release
     releaseTag: str
     asset: str
@@ -63,40 +94,235 @@ class CacheItem(TypedDict):
     lastChecked: float
     checkInterval: typing.Optional[int]
     meta: CacheItemParams
+    # http validators of the last download (webTarget | githubRawFile)
+    validators: typing.NotRequired[Validators]
+    # id, updated_at and size of every downloaded asset (githubRelease)
+    releaseAssets: typing.NotRequired[typing.Dict[str, dict]]
+    # commit checked out by the last renewal (gitRepo)
+    commit: typing.NotRequired[str]
+    # disk usage after the last renewal
+    size: typing.NotRequired[int]
+    # access tracking, updated whenever the item is resolved
+    lastAccess: typing.NotRequired[float]
+    hits: typing.NotRequired[int]
+    # pinned items are never evicted, evicted items keep their metadata only
+    pinned: typing.NotRequired[bool]
+    evicted: typing.NotRequired[bool]
+
+
+class _OpenOnAccess:
+    """
+    placeholder for a store attribute of Cacher, opens the stores on first access
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, obj, owner):
+        owner.open()
+        return owner.__dict__[self.name]
+
+
+# attributes of Cacher that are only available once its stores are open
+_STORE_ATTRS = [
+    "CONFIG",
+    "CACHE",
+    "CACHE_PATH",
+    "INDEX",
+    "BLOBS",
+    "GITHUB",
+    "TRANSPORT",
+    "GENERATIONS",
+    "MANIFESTS",
+]
 
 
 class Cacher:
-    CACHE_PATH = os.path.join(USRPATH, "cache.json")
-    try:
-        CACHE: typing.Dict[str, CacheItem] = DictWithAutosave(CACHE_PATH)
-    except:  # noqa
-        CACHE = None
+    USRPATH = USRPATH
+    CONFIG_PATH = os.path.join(USRPATH, "config.json")
     CACHE_DIR = os.path.join(USRPATH, "cache")
+    CHUNK_SIZE = CHUNK_SIZE
+
+    CONFIG: typing.Dict[str, typing.Any] = _OpenOnAccess("CONFIG")
+    CACHE: MetaStore = _OpenOnAccess("CACHE")
+    CACHE_PATH: str = _OpenOnAccess("CACHE_PATH")
+    INDEX = _OpenOnAccess("INDEX")
+    BLOBS: BlobStore = _OpenOnAccess("BLOBS")
+    GITHUB: github.ApiCache = _OpenOnAccess("GITHUB")
+    TRANSPORT: Transport = _OpenOnAccess("TRANSPORT")
+    GENERATIONS: Generations = _OpenOnAccess("GENERATIONS")
+    MANIFESTS: Manifests = _OpenOnAccess("MANIFESTS")
+
+    _lock = threading.RLock()
+    # event loop -> semaphore bounding its concurrent async renewals
+    _asemaphores = weakref.WeakKeyDictionary()
+    # id -> inter-process lock held while the item is renewed or removed
+    _itemLocks: typing.Dict[str, FileLock] = {}
 
     @classmethod
-    def query(cls, string: str):
+    def configure(cls, root: typing.Optional[str] = None):
+        """
+        points the cacher at another root directory, closing any open stores.
+        the new stores are opened lazily on first access
+        """
+        with cls._lock:
+            if isinstance(cls.__dict__.get("CACHE"), MetaStore):
+                cls.__dict__["CACHE"].close()
+                cls.__dict__["TRANSPORT"].close()
+            root = root or USRPATH
+            cls.USRPATH = root
+            cls.CONFIG_PATH = os.path.join(root, "config.json")
+            cls.CACHE_DIR = os.path.join(root, "cache")
+            cls._itemLocks = {}
+            for name in _STORE_ATTRS:
+                setattr(cls, name, _OpenOnAccess(name))
+
+    @classmethod
+    def open(cls, root: typing.Optional[str] = None) -> "type[Cacher]":
+        """
+        opens the config, metadata and blob stores, optionally at another root
+        """
+        with cls._lock:
+            if root is not None and root != cls.USRPATH:
+                cls.configure(root)
+            if isinstance(cls.__dict__.get("CACHE"), MetaStore):
+                return cls
+
+            os.makedirs(cls.CACHE_DIR, exist_ok=True)
+            config = JsonDict(cls.CONFIG_PATH)
+            cache = open_store(cls.USRPATH, config.get("backend", "sqlite"))
+            cls.CONFIG = config
+            cls.CACHE_PATH = cache.path
+            cls.INDEX = cache.index
+            cls.BLOBS = BlobStore(
+                os.path.join(cls.USRPATH, "blobs"), config.get("blobs")
+            )
+            cls.GITHUB = github.ApiCache(
+                os.path.join(cls.USRPATH, "github.json"),
+                ttl=config.get("githubTtl", 600),
+            )
+            cls.TRANSPORT = Transport(
+                timeout=config.get("timeout", 30),
+                retries=config.get("retries", 3),
+                perHost=config.get("perHost", 4),
+                proxy=config.get("proxy"),
+                offline=config.get("offline", False),
+            )
+            cls.GENERATIONS = Generations(
+                cls.CACHE_DIR,
+                keep=config.get("keepGenerations", 1),
+                onRemove=cls.BLOBS.release,
+            )
+            cls.MANIFESTS = Manifests(os.path.join(cls.USRPATH, "manifests"))
+            cls.CACHE = cache
+        return cls
+
+    @classmethod
+    def find(cls, string: str) -> typing.Optional[str]:
+        """
+        returns the id of the item matching an id, `<type>/<id or value>`
+        or any meta value
+        """
         if string in cls.CACHE:
-            return cls.CACHE[string]
+            return string
 
         for CTYPE in TYPES:
             if string.startswith(CTYPE + "/"):
-                for id, item in cls.iter_type(CTYPE):
-                    nonTyped = string[len(CTYPE) + 1 :]
-                    if nonTyped == id:
-                        return item
+                nonTyped = string[len(CTYPE) + 1 :]
+                if nonTyped in cls.CACHE and cls.CACHE[nonTyped]["type"] == CTYPE:
+                    return nonTyped
 
-                    if nonTyped in item["meta"].values():
-                        return item
+                id = cls.INDEX.find_value(nonTyped, CTYPE)
+                if id is not None:
+                    return id
 
-        for id, item in cls.iter_cache():
-            if string in item["meta"].values():
-                return item
+        return cls.INDEX.find_value(string)
+
+    @classmethod
+    def query(cls, string: str):
+        id = cls.find(string)
+        if id is None:
+            return None
+        cls.touch(id)
+        return cls.CACHE[id]
+
+    @classmethod
+    def touch(cls, id: str):
+        """
+        records an access to the item for the eviction policy
+        """
+        item = cls.CACHE[id]
+        item["lastAccess"] = time.time()
+        item["hits"] = item.get("hits", 0) + 1
+        cls.CACHE.save(id)
+
+    @classmethod
+    def pinned_ids(cls) -> typing.Set[str]:
+        """
+        ids of items pinned explicitly or used as zs shells
+        """
+        pinned = {id for id, item in cls.iter_cache() if item.get("pinned")}
+        try:
+            from z2u4.zs.selfResolve import _USRPATH_CONFIG_PATH
+
+            with open(_USRPATH_CONFIG_PATH, "r", encoding="utf-8") as f:
+                pinned.update(json.load(f).get("shells", {}).values())
+        except (ImportError, OSError, ValueError):
+            pass
+        return pinned
+
+    @classmethod
+    def evict(
+        cls, exclude: typing.Collection[str] = (), dryRun: bool = False
+    ) -> typing.List[str]:
+        """
+        deletes the files of the least recently (lru) or least frequently (lfu)
+        used items until the cache fits in the configured quota. evicted items
+        keep their metadata and are fetched again by `check` or `cache`. the
+        items are only looked at once the running total exceeds the quota
+        """
+        quota = cls.CONFIG.get("quota")
+        if quota is None:
+            return []
+        quota = parse_size(quota)
+        if cls.CACHE.total_size() <= quota:
+            return []
+        items = dict(cls.iter_cache())
+        victims = select_evictions(
+            items,
+            quota,
+            cls.CONFIG.get("eviction", "lru"),
+            cls.pinned_ids() | set(exclude),
+        )
+        if dryRun:
+            return victims
+
+        evicted = []
+        for id in victims:
+            # items being renewed right now are left alone
+            lock = cls.item_lock(id)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                logging.info(f"Evicting {id}")
+                cls._drop_files(id)
+                item = items[id]
+                item["evicted"] = True
+                item["size"] = 0
+                cls.CACHE.save(id, now=True)
+                evicted.append(id)
+            finally:
+                lock.release()
+        return evicted
 
     @classmethod
     def purge(cls):
-        os.remove(cls.CACHE_PATH)
-        cls.CACHE = DictWithAutosave(cls.CACHE_PATH)
+        cls.CACHE.clear()
+        cls.BLOBS.clear()
+        cls.GITHUB.clear()
+        cls.MANIFESTS.clear()
         shutil.rmtree(cls.CACHE_DIR, ignore_errors=True)
+        shutil.rmtree(cls._extracted_path(), ignore_errors=True)
         os.makedirs(cls.CACHE_DIR, exist_ok=True)
 
     @classmethod
@@ -106,17 +332,81 @@ class Cacher:
 
     @classmethod
     def iter_type(cls, type: TYPE_LITERAL) -> typing.Iterator[tuple[str, CacheItem]]:
-        for key, value in cls.iter_cache():
-            if value["type"] == type:
-                yield key, value
+        for key in cls.INDEX.of_type(type):
+            yield key, cls.CACHE[key]
+
+    @classmethod
+    def item_lock(cls, id: str) -> FileLock:
+        """
+        lock serializing renewals and removal of `id` across threads and
+        processes
+        """
+        with cls._lock:
+            lock = cls._itemLocks.get(id)
+            if lock is None:
+                lock = FileLock(os.path.join(cls.USRPATH, "locks", f"{id}.lock"))
+                cls._itemLocks[id] = lock
+        return lock
 
     @classmethod
     def remove(cls, id: str):
         if id not in cls.CACHE:
             raise ValueError(f"Item {id} not found")
-        del cls.CACHE[id]
-        cls.CACHE._save()
-        shutil.rmtree(os.path.join(cls.CACHE_DIR, id), ignore_errors=True)
+        with cls.item_lock(id):
+            del cls.CACHE[id]
+            cls._drop_files(id)
+
+    @classmethod
+    def _drop_files(cls, id: str):
+        """
+        deletes everything stored for `id` besides its metadata
+        """
+        cls.GENERATIONS.delete(id)
+        shutil.rmtree(cls._partial_path(id), ignore_errors=True)
+        shutil.rmtree(cls._extracted_path(id), ignore_errors=True)
+        cls.MANIFESTS.delete(id)
+
+    @classmethod
+    def verify(
+        cls,
+        ids: typing.Optional[typing.Iterable[str]] = None,
+        workers: typing.Optional[int] = None,
+        repair: bool = False,
+    ) -> typing.Dict[str, VerifyReport]:
+        """
+        rehashes the files of `ids`, every stored item by default, against the
+        digests recorded at their last renewal. broken items are fetched again
+        from scratch when `repair` is set. items without files or manifest
+        are not reported
+        """
+        trees = {}
+        for id in cls.CACHE if ids is None else ids:
+            manifest = cls.MANIFESTS.get(id)
+            if manifest is None or cls.CACHE[id].get("evicted"):
+                continue
+            trees[id] = (cls.get_path(id), manifest)
+
+        reports = verify_trees(trees, workers)
+        if repair:
+            for id, report in reports.items():
+                if any(report.values()):
+                    cls.repair(id)
+        return reports
+
+    @classmethod
+    def repair(cls, id: str):
+        """
+        drops the files and validators of `id` and renews it
+        """
+        with cls.item_lock(id):
+            item = cls.CACHE.reload(id)
+            cls._drop_files(id)
+            item.pop("validators", None)
+            item.pop("commit", None)
+            item["evicted"] = True
+            item["size"] = 0
+            cls.CACHE.save(id, now=True)
+        cls.renew(id)
 
     @classmethod
     def process_params(
@@ -161,13 +451,20 @@ class Cacher:
                     f"https://raw.githubusercontent.com/{kwargs['owner']}/{kwargs['repo']}/{kwargs['branch']}/{kwargs['path']}"
                 )
         elif type_ == "gitRepo":
+            if "depth" in kwargs:
+                kwargs["depth"] = int(kwargs["depth"])
+            if isinstance(kwargs.get("sparse"), str):
+                kwargs["sparse"] = kwargs["sparse"].split(",")
+
             if "url" in kwargs and kwargs["url"].startswith("https://github.com/"):
-                if kwargs["url"].endswith(".git"):
-                    kwargs["url"] = kwargs["url"][:-3]
-                raw_params = extract_githuburl_params(kwargs["url"])
-                kwargs["owner"] = raw_params["owner"]
-                kwargs["repo"] = raw_params["repo"]
-                kwargs["branch"] = raw_params["branch"]
+                match = re.match(
+                    r"https://github\.com/([^/]+)/([^/]+?)(?:\.git)?(?:/tree/(.+?))?/?$",
+                    kwargs["url"],
+                )
+                assert match, f"invalid github url: {kwargs['url']}"
+                kwargs["owner"], kwargs["repo"], branch = match.groups()
+                if branch:
+                    kwargs["branch"] = branch
 
                 kwargs["url"] = (
                     f"https://github.com/{kwargs['owner']}/{kwargs['repo']}.git"
@@ -185,6 +482,11 @@ class Cacher:
                     f"https://github.com/{kwargs['owner']}/{kwargs['repo']}.git"
                 )
 
+            elif "url" in kwargs:
+                # any other remote git understands (ssh, file://, other hosts)
+                name = kwargs["url"].rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+                kwargs.setdefault("repo", name[:-4] if name.endswith(".git") else name)
+
             else:
                 assert "owner" in kwargs, "owner must be provided"
                 assert "repo" in kwargs, "repo must be provided"
@@ -226,7 +528,7 @@ class Cacher:
         item = cls.CACHE[id]
         lastChecked = datetime.datetime.fromtimestamp(item["lastChecked"])
         logging.info(f"Item {id} last checked: {lastChecked}")
-        if "checkInterval" not in item:
+        if item.get("checkInterval") is None:
             return False
         if (
             lastChecked + datetime.timedelta(seconds=item["checkInterval"])
@@ -235,18 +537,73 @@ class Cacher:
             return True
         return False
 
+    @classmethod
+    def isDue(cls, id: str, force: bool = False) -> bool:
+        # force
+        # due for checking
+        # missing or empty
+        if force or cls.shouldCheck(id):
+            return True
+        path = cls.get_path(id)
+        return not os.path.isdir(path) or len(os.listdir(path)) == 0
+
     @classmethod
     def check(cls, id: str, force: bool = False):
-        # not force
-        # not due for checking
-        # not empty
-        if not force and not cls.shouldCheck(id) and not len(os.listdir(cls.get_path(id))) == 0:
+        if not cls.isDue(id, force):
             logging.info(f"Item {id} is not due for checking")
             return 0
 
         cls.renew(id)
+        cls.evict(exclude=[id])
         return 1
 
+    @classmethod
+    def check_all(
+        cls,
+        force: bool = False,
+        workers: int = 8,
+        perHost: int = 2,
+    ) -> typing.List[dict]:
+        """
+        renews every due item in a thread pool, with at most `perHost`
+        concurrent renewals against the same host
+        """
+        results = []
+        due = []
+        for id, item in cls.iter_cache():
+            if (force or not item.get("evicted")) and cls.isDue(id, force):
+                due.append(id)
+            else:
+                results.append(
+                    {"id": id, "type": item["type"], "status": "skipped", "seconds": 0.0}
+                )
+
+        hostLocks = {}
+        for id in due:
+            host = get_item_host(cls.CACHE[id])
+            if host not in hostLocks:
+                hostLocks[host] = threading.BoundedSemaphore(perHost)
+
+        def _renew(id: str) -> dict:
+            item = cls.CACHE[id]
+            result = {"id": id, "type": item["type"], "status": "renewed"}
+            with hostLocks[get_item_host(item)]:
+                start = time.perf_counter()
+                try:
+                    cls.renew(id)
+                except Exception as e:  # noqa
+                    logging.exception(f"Failed to renew {id}")
+                    result["status"] = "failed"
+                    result["error"] = str(e)
+                result["seconds"] = time.perf_counter() - start
+            return result
+
+        with cls.CACHE.batch(), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results.extend(pool.map(_renew, due))
+
+        cls.evict()
+        return results
+
     @classmethod
     def cache(
         cls,
@@ -255,108 +612,626 @@ class Cacher:
         _checkInteval: typing.Optional[int] = 24 * 60 * 60,
         **kwargs: typing.Unpack[CacheItemParams],
     ) -> str:
-        params = cls.process_params(type_, kwargs)
-        for id, item in cls.iter_type(type_):
-            if item["meta"] == params:
-                if _check:
-                    cls.check(id)
-                return id
-
-        id = str(uuid.uuid4())
-        print("Caching item", id)
-        cls.CACHE[id] = {
-            "type": type_,
-            "lastChecked": datetime.datetime.now().timestamp(),
-            "checkInterval": _checkInteval,
-            "meta": params,
-        }
-        cls.renew(id)
+        id, created = cls._register(type_, _checkInteval, kwargs)
+        if created:
+            cls.renew(id)
+            cls.evict(exclude=[id])
+        elif _check:
+            cls.check(id)
         return id
 
+    @classmethod
+    def _register(
+        cls,
+        type_: TYPE_LITERAL,
+        checkInterval: typing.Optional[int],
+        kwargs: CacheItemParams,
+    ) -> typing.Tuple[str, bool]:
+        """
+        returns the id of the item with these params, adding it if it is new
+        """
+        params = cls.process_params(type_, kwargs)
+        with cls.item_lock("register"):
+            # another process may have added the same item meanwhile
+            cls.CACHE.sync()
+            id = cls.INDEX.find_params(type_, params)
+            if id is not None and cls.CACHE[id]["meta"] == params:
+                return id, False
+
+            id = str(uuid.uuid4())
+            print("Caching item", id)
+            cls.CACHE[id] = {
+                "type": type_,
+                "lastChecked": datetime.datetime.now().timestamp(),
+                "checkInterval": checkInterval,
+                "meta": params,
+            }
+        return id, True
+
     @classmethod
     def renew(cls, id: str):
-        item = cls.CACHE[id]
+        """
+        renews `id` while holding its item lock. when another thread or process
+        renewed the item while this one waited for the lock, its result is
+        reused instead of renewing again.
 
-        specfunc = getattr(cls, f"renew_{item['type']}")
-        specfunc(id, item)
+        the handler works on a staging directory, which is published as a new
+        generation only once it completed. handlers check cheaply for changes
+        first and `_seed` the stage with the live files only when they are
+        about to write. they return False when nothing changed, the live
+        generation is kept then
+        """
+        seen = cls.CACHE[id]["lastChecked"]
+        with cls.item_lock(id):
+            item = cls._claim(id, seen)
+            if item is None or not cls._renew_started(id, item):
+                return
+            stage = cls.GENERATIONS.stage(id)
+            try:
+                changed = getattr(cls, f"renew_{item['type']}")(id, item, stage)
+                cls._renew_finished(id, item, stage, changed)
+            finally:
+                cls.GENERATIONS.discard(stage)
+
+    @classmethod
+    def rollback(cls, id: str, generation: typing.Optional[int] = None) -> int:
+        """
+        points `id` back at a previous generation kept by `keepGenerations`
+        """
+        with cls.item_lock(id):
+            generation = cls.GENERATIONS.rollback(id, generation)
+            item = cls.CACHE[id]
+            item["size"] = tree_size(cls.get_path(id))
+            cls.CACHE.save(id, now=True)
+            cls.MANIFESTS.write(id, cls._build_manifest(id))
+        return generation
+
+    @classmethod
+    def set_compressed(cls, id: str, enabled: typing.Optional[bool]):
+        """
+        overrides the `compress` config for `id`, None follows it again. the
+        live generation is repacked right away
+        """
+        with cls.item_lock(id):
+            item = cls.CACHE.reload(id)
+            if enabled is None:
+                item.pop("compress", None)
+            else:
+                item["compress"] = enabled
+            live = cls.get_path(id)
+            if os.path.isdir(live) and archive.is_packed(live) != cls.compressed(item):
+                stage = cls.GENERATIONS.stage(id)
+                try:
+                    cls._seed(id, stage)
+                    if cls.compressed(item):
+                        archive.pack(stage, cls.CONFIG.get("compressLevel", 6))
+                    if cls.BLOBS.enabled and item["type"] in BLOB_TYPES:
+                        cls.BLOBS.ingest(id, stage, cls.GENERATIONS.next(id))
+                    item["size"] = tree_size(stage)
+                    cls.GENERATIONS.publish(id, stage)
+                finally:
+                    cls.GENERATIONS.discard(stage)
+            cls.CACHE.save(id, now=True)
+
+    @classmethod
+    def _claim(cls, id: str, seen: float) -> typing.Optional[CacheItem]:
+        """
+        reloads `id` once its lock is held, None if it was renewed since
+        `lastChecked` was `seen`
+        """
+        item = cls.CACHE.reload(id)
+        if item["lastChecked"] != seen:
+            logging.info(f"Item {id} was renewed concurrently, reusing it")
+            return None
+        return item
+
+    @classmethod
+    def _seed(cls, id: str, stage: str):
+        """
+        fills `stage` with the live files of `id` the handler did not write,
+        unpacking a compressed generation so handlers see files
+        """
+        packed = cls.open_archive(id)
+        if packed is None:
+            cls.GENERATIONS.seed(id, stage)
+            return
+        with packed:
+            for name in packed.names():
+                if not os.path.lexists(os.path.join(stage, *name.split("/"))):
+                    packed.extract(name, stage)
+
+    @classmethod
+    def _live_size(cls, id: str, name: str) -> typing.Optional[int]:
+        """
+        size of file `name` of the live generation of `id`, None when missing.
+        compressed generations are answered from the archive directory
+        """
+        packed = cls.open_archive(id)
+        if packed is None:
+            path = os.path.join(cls.get_path(id), *name.split("/"))
+            return os.path.getsize(path) if os.path.isfile(path) else None
+        with packed:
+            try:
+                return packed.info(name).file_size
+            except KeyError:
+                return None
+
+    @classmethod
+    def _partial_path(cls, id: str) -> str:
+        """
+        directory of the part files of `id`, kept across failed renewals so
+        downloads resume
+        """
+        return os.path.join(cls.CACHE_DIR, ".partial", id)
+
+    @classmethod
+    def _renew_started(cls, id: str, item: CacheItem) -> bool:
+        if cls.TRANSPORT.offline and get_item_host(item) != "local":
+            logging.info(f"Offline, not renewing {id}")
+            return False
+        return True
+
+    @classmethod
+    def _renew_finished(
+        cls, id: str, item: CacheItem, stage: str, changed: typing.Optional[bool]
+    ):
+        """
+        validates `stage` and publishes it, unless the handler reported no change
+        """
+        live = cls.get_path(id)
+        compress = cls.compressed(item)
+        if (
+            changed is not False
+            or not os.path.isdir(live)
+            or archive.is_packed(live) != compress
+        ):
+            if changed is False:
+                # only repacked, the handler left the stage empty
+                cls._seed(id, stage)
+            if not os.listdir(stage):
+                raise IOError(f"Renewal of {id} produced no files")
+            manifest = build_manifest(stage, cls.MANIFESTS.get(id))
+            if compress:
+                archive.pack(stage, cls.CONFIG.get("compressLevel", 6))
+            if cls.BLOBS.enabled and item["type"] in BLOB_TYPES:
+                cls.BLOBS.ingest(id, stage, cls.GENERATIONS.next(id))
+            item["size"] = tree_size(stage)
+            cls.GENERATIONS.publish(id, stage)
+            cls.MANIFESTS.write(id, manifest)
+        item.pop("evicted", None)
         item["lastChecked"] = datetime.datetime.now().timestamp()
-        cls.CACHE._save()
+        cls.CACHE.save(id, now=True)
 
     @classmethod
-    def renew_githubRawFile(cls, id: str, item: CacheItem):
-        from zuu.APP.github import download_raw_content
+    def _async_limit(cls) -> "asyncio.Semaphore":
+        """
+        semaphore of the running event loop bounding concurrent async renewals
+        """
+        import asyncio
 
-        os.makedirs(os.path.join(cls.CACHE_DIR, id), exist_ok=True)
-        download_raw_content(item["meta"]["url"], os.path.join(cls.CACHE_DIR, id))
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            semaphore = cls._asemaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(cls.CONFIG.get("asyncLimit", 16))
+                cls._asemaphores[loop] = semaphore
+        return semaphore
 
     @classmethod
-    def renew_githubRelease(cls, id: str, item: CacheItem):
-        from zuu.APP.github import download_release, release_meta, get_releases
+    async def arenew(cls, id: str):
+        """
+        renews `id` on the event loop. downloads go through the async client,
+        other types run their sync handler in a worker thread. cancelling
+        discards in-flight downloads
+        """
+        import asyncio
 
-        os.makedirs(os.path.join(cls.CACHE_DIR, id), exist_ok=True)
-        asset = item["meta"].get("asset", None)
-        assets = item["meta"].get("assets", [])
-        if asset:
-            assets.append(asset)
-        if not assets:
-            assets = None
-        rtag = item["meta"].get("releaseTag", "latest")
-        if rtag == "latest":
-            meta = get_releases(
-                repo=f"{item['meta']['owner']}/{item['meta']['repo']}",
-                limit=1,
-            )
-            meta = meta[0]
-        else:
-            meta = release_meta(
-                repo=item["meta"]["repo"],
-                name=rtag,
-            )
-        pprint.pprint(meta)
-        download_release(
-            meta,
-            save_path=os.path.join(cls.CACHE_DIR, id),
-            match_type="glob",
-            asset_names=[".*"],
+        async with cls._async_limit():
+            item = cls.CACHE[id]
+            handler = getattr(cls, f"arenew_{item['type']}", None)
+            if handler is None:
+                await asyncio.to_thread(cls.renew, id)
+                return
+
+            seen = item["lastChecked"]
+            lock = cls.item_lock(id)
+            while not lock.acquire(blocking=False):
+                await asyncio.sleep(lock.poll)
+            stage = None
+            try:
+                item = await asyncio.to_thread(cls._claim, id, seen)
+                if item is None or not cls._renew_started(id, item):
+                    return
+                stage = await asyncio.to_thread(cls.GENERATIONS.stage, id)
+                changed = await handler(id, item, stage)
+                await asyncio.to_thread(cls._renew_finished, id, item, stage, changed)
+            finally:
+                if stage is not None:
+                    cls.GENERATIONS.discard(stage)
+                lock.release()
+
+    @classmethod
+    async def acheck(cls, id: str, force: bool = False) -> int:
+        import asyncio
+
+        if not cls.isDue(id, force):
+            return 0
+        await cls.arenew(id)
+        await asyncio.to_thread(cls.evict, [id])
+        return 1
+
+    @classmethod
+    async def acache(
+        cls,
+        type_: TYPE_LITERAL,
+        _check: bool = True,
+        _checkInteval: typing.Optional[int] = 24 * 60 * 60,
+        **kwargs: typing.Unpack[CacheItemParams],
+    ) -> str:
+        import asyncio
+
+        id, created = await asyncio.to_thread(
+            cls._register, type_, _checkInteval, kwargs
         )
+        if created:
+            try:
+                await cls.arenew(id)
+            except BaseException:
+                # a cancelled or failed first download leaves nothing behind
+                await asyncio.shield(asyncio.to_thread(cls.remove, id))
+                raise
+            await asyncio.to_thread(cls.evict, [id])
+        elif _check:
+            await cls.acheck(id)
+        return id
+
+    @classmethod
+    async def aquery(cls, string: str):
+        import asyncio
+
+        return await asyncio.to_thread(cls.query, string)
+
+    @classmethod
+    async def aclose(cls):
+        """
+        closes the async client of the running event loop
+        """
+        await cls.TRANSPORT.aclose()
 
     @classmethod
-    def renew_githubGist(cls, id: str, item: CacheItem):
-        from zuu.APP.github import download_gist
+    async def arenew_githubRawFile(cls, id: str, item: CacheItem, path: str):
+        import asyncio
 
-        os.makedirs(os.path.join(cls.CACHE_DIR, id), exist_ok=True)
-        download_gist(
-            gist_id=f"{item['meta']['owner']}/{item['meta']['id']}",
-            save_path=os.path.join(cls.CACHE_DIR, id),
+        res = await adownload(
+            item["meta"]["url"],
+            path,
+            validators=item.get("validators"),
+            filename=os.path.basename(item["meta"]["path"]),
+            client=cls.TRANSPORT.aclient(),
+            chunk_size=cls.CHUNK_SIZE,
+            session=cls.TRANSPORT,
+            part_dir=cls._partial_path(id),
+            exists=lambda name: cls._live_size(id, name) is not None,
         )
+        item["validators"] = res["validators"]
+        if res["notModified"]:
+            return False
+        await asyncio.to_thread(cls._seed, id, path)
+        return True
 
     @classmethod
-    def renew_webTarget(cls, id: str, item: CacheItem):
-        import requests
+    async def arenew_webTarget(cls, id: str, item: CacheItem, path: str):
+        import asyncio
 
-        os.makedirs(os.path.join(cls.CACHE_DIR, id), exist_ok=True)
-        for file in requests.get(item["meta"]["url"]).iter_content(chunk_size=1024):
-            with open(os.path.join(cls.CACHE_DIR, id, file.name), "wb") as f:
-                f.write(file)
+        res = await adownload(
+            item["meta"]["url"],
+            path,
+            validators=item.get("validators"),
+            client=cls.TRANSPORT.aclient(),
+            chunk_size=cls.CHUNK_SIZE,
+            checksum=item["meta"].get("checksum"),
+            session=cls.TRANSPORT,
+            part_dir=cls._partial_path(id),
+            exists=lambda name: cls._live_size(id, name) is not None,
+        )
+        item["validators"] = res["validators"]
+        if res["notModified"]:
+            return False
+        await asyncio.to_thread(cls._seed, id, path)
+        return True
 
     @classmethod
-    def renew_localTarget(cls, id: str, item: CacheItem):
-        import shutil
+    def renew_githubRawFile(cls, id: str, item: CacheItem, path: str):
+        res = download(
+            item["meta"]["url"],
+            path,
+            validators=item.get("validators"),
+            filename=os.path.basename(item["meta"]["path"]),
+            session=cls.TRANSPORT,
+            chunk_size=cls.CHUNK_SIZE,
+            part_dir=cls._partial_path(id),
+            exists=lambda name: cls._live_size(id, name) is not None,
+        )
+        item["validators"] = res["validators"]
+        if res["notModified"]:
+            return False
+        cls._seed(id, path)
+        return True
 
-        os.makedirs(os.path.join(cls.CACHE_DIR, id), exist_ok=True)
-        shutil.copy(item["meta"]["path"], os.path.join(cls.CACHE_DIR, id))
+    @classmethod
+    def renew_githubRelease(cls, id: str, item: CacheItem, path: str):
+        meta = item["meta"]
+
+        patterns = list(meta.get("assets", []))
+        if meta.get("asset"):
+            patterns.append(meta["asset"])
+        release = github.get_release(
+            meta["owner"],
+            meta["repo"],
+            meta.get("releaseTag", "latest"),
+            session=cls.TRANSPORT,
+            cache=cls.GITHUB,
+        )
+        assets = github.select_assets(release["assets"], patterns)
+
+        previous = item.get("releaseAssets", {})
+        state = {
+            asset["name"]: {
+                "id": asset["id"],
+                "updatedAt": asset["updated_at"],
+                "size": asset["size"],
+            }
+            for asset in assets
+        }
+        todo = [
+            asset
+            for asset in assets
+            if previous.get(asset["name"]) != state[asset["name"]]
+            or cls._live_size(id, asset["name"]) != asset["size"]
+        ]
+        # assets no longer selected or gone from the release
+        removed = set(previous) - set(state)
+        if not todo and not removed:
+            item["releaseAssets"] = state
+            return False
+
+        cls._seed(id, path)
+        partial = cls._partial_path(id)
+        workers = cls.CONFIG.get("assetWorkers", 4)
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo) or 1))) as pool:
+            list(pool.map(lambda asset: cls._download_asset(path, asset, partial), todo))
+
+        for name in removed:
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+        item["releaseAssets"] = state
+        return True
+
+    @classmethod
+    def _download_asset(cls, path: str, asset: dict, partial: str):
+        """
+        downloads a release asset, in concurrent ranged segments when it is
+        larger than the `segmentSize` config, and verifies its size and digest
+        """
+        url = asset["browser_download_url"]
+        # github reports "sha256:<hex>" digests for assets uploaded since 2025
+        checksum = asset.get("digest")
+        segmentSize = parse_size(cls.CONFIG.get("segmentSize", "64M"))
+        target = os.path.join(path, asset["name"])
+        if asset["size"] > segmentSize:
+            try:
+                download_segmented(
+                    url,
+                    path,
+                    asset["name"],
+                    asset["size"],
+                    segments=-(-asset["size"] // segmentSize),
+                    session=cls.TRANSPORT,
+                    chunk_size=cls.CHUNK_SIZE,
+                    checksum=checksum,
+                    part_dir=partial,
+                )
+                return
+            except IOError:
+                logging.info(f"Ranged download of {url} failed, retrying in one piece")
+
+        download(
+            url,
+            path,
+            filename=asset["name"],
+            session=cls.TRANSPORT,
+            chunk_size=cls.CHUNK_SIZE,
+            checksum=checksum,
+            part_dir=partial,
+        )
+        if os.path.getsize(target) != asset["size"]:
+            os.remove(target)
+            raise IOError(f"Size mismatch for {asset['name']}")
+
+    @classmethod
+    def renew_githubGist(cls, id: str, item: CacheItem, path: str):
+        gist = github.get_gist(
+            item["meta"]["id"], session=cls.TRANSPORT, cache=cls.GITHUB
+        )
+        cls._seed(id, path)
+        for name, file in gist["files"].items():
+            # the api inlines the content of files up to 1 MB
+            if file.get("truncated") or file.get("content") is None:
+                download(
+                    file["raw_url"],
+                    path,
+                    filename=name,
+                    session=cls.TRANSPORT,
+                    chunk_size=cls.CHUNK_SIZE,
+                    part_dir=cls._partial_path(id),
+                )
+                continue
+            tmp = os.path.join(path, f".{name}.tmp")
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(file["content"])
+            os.replace(tmp, os.path.join(path, name))
 
     @classmethod
-    def renew_gitRepo(cls, id: str, item: CacheItem):
-        from zuu.APP.git import update_repo
+    def renew_webTarget(cls, id: str, item: CacheItem, path: str):
+        res = download(
+            item["meta"]["url"],
+            path,
+            validators=item.get("validators"),
+            session=cls.TRANSPORT,
+            chunk_size=cls.CHUNK_SIZE,
+            checksum=item["meta"].get("checksum"),
+            part_dir=cls._partial_path(id),
+            exists=lambda name: cls._live_size(id, name) is not None,
+        )
+        item["validators"] = res["validators"]
+        if res["notModified"]:
+            return False
+        cls._seed(id, path)
+        return True
 
-        os.makedirs(os.path.join(cls.CACHE_DIR, id), exist_ok=True)
-        update_repo(
-            path=os.path.join(cls.CACHE_DIR, id),
-            url=item["meta"]["url"],
-            branch=item["meta"].get("branch", "None"),
+    @classmethod
+    def renew_localTarget(cls, id: str, item: CacheItem, path: str):
+        useHash = cls.CONFIG.get("syncHash", False)
+        manifest = cls.MANIFESTS.get(id)
+        if (
+            manifest is not None
+            and os.path.isdir(cls.get_path(id))
+            and matches_manifest(item["meta"]["path"], manifest, useHash)
+        ):
+            return False
+
+        cls._seed(id, path)
+        stats = sync_tree(
+            item["meta"]["path"],
+            path,
+            useHash=useHash,
+            link=cls.CONFIG.get("syncLinks", False),
         )
+        logging.info(f"Synced {id}: {stats}")
+        return bool(stats["copied"] or stats["deleted"])
+
+    @classmethod
+    def renew_gitRepo(cls, id: str, item: CacheItem, path: str):
+        meta = item["meta"]
+        branch = meta.get("branch") or None
+        depth = meta.get("depth", cls.CONFIG.get("gitDepth", 1))
+        cloned = os.path.isdir(os.path.join(cls.get_path(id), ".git"))
+
+        # only the remote ref is asked for while nothing changed
+        remote = git.ls_remote(meta["url"], branch)
+        if cloned and remote is not None and item.get("commit") == remote:
+            logging.info(f"Item {id} is at {remote}, skipping fetch")
+            return False
+
+        if cloned:
+            cls._seed(id, path)
+            git.update(path, branch, depth)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+            git.clone(
+                meta["url"],
+                path,
+                branch,
+                depth=depth,
+                filter=cls.CONFIG.get("gitFilter", "blob:none"),
+                sparse=meta.get("sparse"),
+            )
+        item["commit"] = git.head(path)
 
     @classmethod
     def get_path(cls, id: str):
         return os.path.join(cls.CACHE_DIR, id)
+
+    @classmethod
+    def _build_manifest(cls, id: str) -> Manifest:
+        return build_manifest(cls.extract(id), cls.MANIFESTS.get(id))
+
+    @classmethod
+    def manifest(cls, id: str) -> Manifest:
+        """
+        files of `id` recorded at its last renewal, built now for items cached
+        before manifests were recorded
+        """
+        manifest = cls.MANIFESTS.get(id)
+        if manifest is None:
+            with cls.item_lock(id):
+                manifest = cls._build_manifest(id)
+                cls.MANIFESTS.write(id, manifest)
+        return manifest
+
+    @classmethod
+    def resolve(cls, string: str, pattern: str) -> typing.List[str]:
+        """
+        paths of the files of the item found by `string` matching `pattern`,
+        an exact relative path, a glob or a basename. the lookup is answered
+        from the manifest, only matched files of compressed items are extracted
+        """
+        id = cls.find(string)
+        if id is None:
+            raise ValueError(f"Item {string} not found")
+        if cls.CACHE[id].get("evicted") or not os.path.isdir(cls.get_path(id)):
+            cls.check(id, force=True)
+        cls.touch(id)
+        return [cls.extract(id, rel) for rel in match(cls.manifest(id), pattern)]
+
+    @classmethod
+    def compressed(cls, item: CacheItem) -> bool:
+        """
+        whether `item` is kept as a single archive, per item or by the
+        `compress` config. git checkouts are never compressed
+        """
+        if item["type"] not in BLOB_TYPES:
+            return False
+        return item.get("compress", cls.CONFIG.get("compress", False))
+
+    @classmethod
+    def _extracted_path(cls, id: typing.Optional[str] = None) -> str:
+        root = os.path.join(cls.USRPATH, "extracted")
+        return root if id is None else os.path.join(root, id)
+
+    @classmethod
+    def open_archive(cls, id: str) -> typing.Optional[archive.Archive]:
+        """
+        archive of a compressed item, None when its files are stored as is
+        """
+        path = os.path.join(cls.get_path(id), archive.ARCHIVE_NAME)
+        if not os.path.isfile(path):
+            return None
+        return archive.Archive(path)
+
+    @classmethod
+    def open_member(cls, id: str, member: str) -> typing.IO[bytes]:
+        """
+        reads one file of `id` without extracting the others
+        """
+        packed = cls.open_archive(id)
+        if packed is None:
+            return open(os.path.join(cls.get_path(id), *member.split("/")), "rb")
+        return packed.open(member)
+
+    @classmethod
+    def extract(cls, id: str, member: typing.Optional[str] = None) -> str:
+        """
+        path of `member` of `id`, or of its whole directory. compressed items
+        are extracted on demand into a cache kept until the next generation
+        """
+        packed = cls.open_archive(id)
+        if packed is None:
+            path = cls.get_path(id)
+            return path if member is None else os.path.join(path, *member.split("/"))
+
+        with packed:
+            root = cls._extracted_path(id)
+            key = str(os.stat(packed.path).st_mtime_ns)
+            if os.path.isdir(root):
+                for name in os.listdir(root):
+                    if name != key:
+                        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            root = os.path.join(root, key)
+            for name in packed.names() if member is None else [member]:
+                target = os.path.join(root, *name.split("/"))
+                if not os.path.exists(target):
+                    packed.extract(name, root)
+        return root if member is None else os.path.join(root, *member.split("/"))
@@ -0,0 +1,408 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import typing
+from urllib.parse import unquote, urlparse
+
+from .utils import dump_json_atomic
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class Validators(typing.TypedDict, total=False):
+    etag: str
+    lastModified: str
+    contentLength: int
+    filename: str
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class DownloadResult(typing.TypedDict):
+    status: int
+    notModified: bool
+    path: typing.Optional[str]
+    validators: Validators
+
+
+def filename_from_response(response, url: str) -> str:
+    disposition = response.headers.get("Content-Disposition", "")
+    match = re.search(r"filename\*?=(?:UTF-8'')?\"?([^\";]+)\"?", disposition)
+    if match:
+        name = os.path.basename(unquote(match.group(1)).strip())
+        if name:
+            return name
+    name = os.path.basename(unquote(urlparse(url).path))
+    return name or "download"
+
+
+def conditional_headers(
+    validators: typing.Optional[Validators],
+    dest_dir: str,
+    exists: typing.Optional[typing.Callable[[str], bool]] = None,
+) -> typing.Dict[str, str]:
+    """
+    Returns the If-None-Match / If-Modified-Since headers for a previous download,
+    or nothing when the previously downloaded file is no longer on disk. `exists`
+    tells whether it is, by default it is looked for in `dest_dir`.
+    """
+    if not validators or "filename" not in validators:
+        return {}
+    name = validators["filename"]
+    if exists is not None:
+        found = exists(name)
+    else:
+        found = os.path.exists(os.path.join(dest_dir, name))
+    if not found:
+        return {}
+
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("lastModified"):
+        headers["If-Modified-Since"] = validators["lastModified"]
+    return headers
+
+
+def validators_from_response(response, filename: str) -> Validators:
+    validators: Validators = {"filename": filename}
+    if "ETag" in response.headers:
+        validators["etag"] = response.headers["ETag"]
+    if "Last-Modified" in response.headers:
+        validators["lastModified"] = response.headers["Last-Modified"]
+    match = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+    if match:
+        validators["contentLength"] = int(match.group(1))
+    elif "Content-Length" in response.headers:
+        validators["contentLength"] = int(response.headers["Content-Length"])
+    return validators
+
+
+def new_hasher(checksum: typing.Optional[str]):
+    """
+    parses "<algo>:<hexdigest>" (or a bare sha256 hexdigest) into a hasher and
+    the expected digest
+    """
+    if not checksum:
+        return None, None
+    algo, _, digest = checksum.partition(":")
+    if not digest:
+        algo, digest = "sha256", algo
+    return hashlib.new(algo), digest.lower()
+
+
+def _part_paths(dest_dir: str, url: str) -> typing.Tuple[str, str]:
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    part = os.path.join(dest_dir, f".part-{key}")
+    return part, part + ".json"
+
+
+def _resume_state(part: str, partMeta: str) -> typing.Tuple[int, Validators]:
+    if not os.path.exists(part) or not os.path.exists(partMeta):
+        return 0, {}
+    try:
+        with open(partMeta, "r", encoding="utf-8") as f:
+            partValidators = json.load(f)
+    except (OSError, ValueError):
+        return 0, {}
+    return os.path.getsize(part), partValidators
+
+
+def _discard(*paths: str):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _verify_checksum(path: str, checksum: typing.Optional[str], chunk_size: int) -> bool:
+    hasher, digest = new_hasher(checksum)
+    if hasher is None:
+        return True
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest() == digest
+
+
+def download(
+    url: str,
+    dest_dir: str,
+    validators: typing.Optional[Validators] = None,
+    filename: typing.Optional[str] = None,
+    session=None,
+    timeout: float = 30,
+    chunk_size: int = CHUNK_SIZE,
+    checksum: typing.Optional[str] = None,
+    attempts: int = 3,
+    cancel: typing.Optional[threading.Event] = None,
+    part_dir: typing.Optional[str] = None,
+    exists: typing.Optional[typing.Callable[[str], bool]] = None,
+) -> DownloadResult:
+    """
+    Streams `url` into `dest_dir`, revalidating against `validators` from a
+    previous download. A 304 response leaves the disk untouched.
+
+    The body is written in `chunk_size` pieces to a hidden part file that is
+    renamed into place once complete (and matching `checksum`, if given).
+    Interrupted transfers resume from the part file with an HTTP Range request,
+    both on retry and across calls. Part files live in `part_dir`, `dest_dir`
+    by default, which must be on the same filesystem. Setting `cancel` aborts
+    the transfer between chunks, discarding the part file, with DownloadCancelled.
+
+    `exists` is passed on to `conditional_headers`.
+    """
+    import requests
+
+    session = session or requests
+    os.makedirs(dest_dir, exist_ok=True)
+    os.makedirs(part_dir or dest_dir, exist_ok=True)
+    part, partMeta = _part_paths(part_dir or dest_dir, url)
+
+    for attempt in range(attempts):
+        conditional = conditional_headers(validators, dest_dir, exists)
+        headers = dict(conditional)
+        offset, partValidators = _resume_state(part, partMeta)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            ifRange = partValidators.get("etag") or partValidators.get("lastModified")
+            if ifRange:
+                headers["If-Range"] = ifRange
+
+        try:
+            with session.get(
+                url, headers=headers, timeout=timeout, stream=True
+            ) as response:
+                if response.status_code == 304:
+                    # only meaningful as an answer to our conditional headers
+                    if not conditional:
+                        raise IOError(f"Unexpected 304 for unconditional request of {url}")
+                    return {
+                        "status": 304,
+                        "notModified": True,
+                        "path": os.path.join(dest_dir, validators["filename"]),
+                        "validators": validators,
+                    }
+
+                if response.status_code == 416:
+                    # the part file no longer matches the remote
+                    _discard(part, partMeta)
+                    continue
+
+                response.raise_for_status()
+                name = filename or partValidators.get("filename")
+                if response.status_code != 206:
+                    offset = 0
+                    name = filename or filename_from_response(response, url)
+                newValidators = validators_from_response(response, name)
+                dump_json_atomic(partMeta, newValidators)
+
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if cancel is not None and cancel.is_set():
+                            break
+                        f.write(chunk)
+                if cancel is not None and cancel.is_set():
+                    _discard(part, partMeta)
+                    raise DownloadCancelled(url)
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ):
+            if attempt == attempts - 1:
+                raise
+            continue
+
+        expected = newValidators.get("contentLength")
+        if expected is not None and os.path.getsize(part) < expected:
+            if attempt == attempts - 1:
+                raise IOError(f"Incomplete download of {url}")
+            continue
+        break
+    else:
+        raise IOError(f"Failed to download {url}")
+
+    if not _verify_checksum(part, checksum, chunk_size):
+        _discard(part, partMeta)
+        raise ValueError(f"Checksum mismatch for {url}")
+
+    path = os.path.join(dest_dir, newValidators["filename"])
+    os.replace(part, path)
+    _discard(partMeta)
+
+    return {
+        "status": response.status_code,
+        "notModified": False,
+        "path": path,
+        "validators": newValidators,
+    }
+
+
+def download_segmented(
+    url: str,
+    dest_dir: str,
+    filename: str,
+    size: int,
+    segments: int = 4,
+    session=None,
+    timeout: float = 30,
+    chunk_size: int = CHUNK_SIZE,
+    checksum: typing.Optional[str] = None,
+    part_dir: typing.Optional[str] = None,
+) -> str:
+    """
+    Downloads a file of known `size` as `segments` concurrent Range requests
+    written into one preallocated part file, which is renamed into place once
+    every segment is complete (and matching `checksum`, if given).
+
+    Raises IOError when the server does not honor range requests, callers fall
+    back to `download` then.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+
+    session = session or requests
+    os.makedirs(dest_dir, exist_ok=True)
+    os.makedirs(part_dir or dest_dir, exist_ok=True)
+    part, partMeta = _part_paths(part_dir or dest_dir, url)
+    _discard(partMeta)
+    with open(part, "wb") as f:
+        f.truncate(size)
+
+    step = -(-size // max(1, segments))
+    bounds = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+    def fetch(bound: typing.Tuple[int, int]):
+        start, end = bound
+        written = 0
+        with session.get(
+            url, headers={"Range": f"bytes={start}-{end}"}, timeout=timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IOError(f"{url} does not support range requests")
+            with open(part, "r+b") as f:
+                f.seek(start)
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+        if written != end - start + 1:
+            raise IOError(f"Incomplete segment {start}-{end} of {url}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(bounds)) as pool:
+            list(pool.map(fetch, bounds))
+        if not _verify_checksum(part, checksum, chunk_size):
+            raise ValueError(f"Checksum mismatch for {url}")
+    except BaseException:
+        _discard(part)
+        raise
+
+    path = os.path.join(dest_dir, filename)
+    os.replace(part, path)
+    return path
+
+
+async def adownload(
+    url: str,
+    dest_dir: str,
+    validators: typing.Optional[Validators] = None,
+    filename: typing.Optional[str] = None,
+    client=None,
+    chunk_size: int = CHUNK_SIZE,
+    checksum: typing.Optional[str] = None,
+    session=None,
+    part_dir: typing.Optional[str] = None,
+    exists: typing.Optional[typing.Callable[[str], bool]] = None,
+) -> DownloadResult:
+    """
+    Async variant of `download` on an httpx.AsyncClient. Without a client the
+    sync download runs on `session` in a worker thread instead.
+
+    Cancelling the awaiting task aborts the transfer and discards the part file.
+    """
+    import asyncio
+
+    if client is None:
+        cancel = threading.Event()
+        try:
+            return await asyncio.to_thread(
+                download,
+                url,
+                dest_dir,
+                validators=validators,
+                filename=filename,
+                session=session,
+                chunk_size=chunk_size,
+                checksum=checksum,
+                cancel=cancel,
+                part_dir=part_dir,
+                exists=exists,
+            )
+        except asyncio.CancelledError:
+            # the worker notices between chunks and cleans up after itself
+            cancel.set()
+            raise
+
+    os.makedirs(dest_dir, exist_ok=True)
+    os.makedirs(part_dir or dest_dir, exist_ok=True)
+    part, partMeta = _part_paths(part_dir or dest_dir, url)
+    conditional = conditional_headers(validators, dest_dir, exists)
+    headers = dict(conditional)
+    offset, partValidators = _resume_state(part, partMeta)
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        ifRange = partValidators.get("etag") or partValidators.get("lastModified")
+        if ifRange:
+            headers["If-Range"] = ifRange
+
+    try:
+        async with client.stream(
+            "GET", url, headers=headers, follow_redirects=True
+        ) as response:
+            if response.status_code == 304 and conditional:
+                return {
+                    "status": 304,
+                    "notModified": True,
+                    "path": os.path.join(dest_dir, validators["filename"]),
+                    "validators": validators,
+                }
+            response.raise_for_status()
+            name = filename or partValidators.get("filename")
+            if response.status_code != 206:
+                offset = 0
+                name = filename or filename_from_response(response, url)
+            newValidators = validators_from_response(response, name)
+            dump_json_atomic(partMeta, newValidators)
+
+            with open(part, "ab" if offset else "wb") as f:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    f.write(chunk)
+    except asyncio.CancelledError:
+        _discard(part, partMeta)
+        raise
+
+    expected = newValidators.get("contentLength")
+    if expected is not None and os.path.getsize(part) < expected:
+        raise IOError(f"Incomplete download of {url}")
+    if not _verify_checksum(part, checksum, chunk_size):
+        _discard(part, partMeta)
+        raise ValueError(f"Checksum mismatch for {url}")
+
+    path = os.path.join(dest_dir, newValidators["filename"])
+    os.replace(part, path)
+    _discard(partMeta)
+
+    return {
+        "status": response.status_code,
+        "notModified": False,
+        "path": path,
+        "validators": newValidators,
+    }
@@ -0,0 +1,46 @@
+import typing
+
+EVICTION_POLICIES = ["lru", "lfu"]
+
+
+def _lru_key(item: dict):
+    return (item.get("lastAccess") or item["lastChecked"], item.get("hits", 0))
+
+
+def _lfu_key(item: dict):
+    return (item.get("hits", 0), item.get("lastAccess") or item["lastChecked"])
+
+
+def select_evictions(
+    items: typing.Dict[str, dict],
+    quota: int,
+    policy: str = "lru",
+    pinned: typing.Collection[str] = (),
+) -> typing.List[str]:
+    """
+    returns the ids to evict so the recorded sizes of `items` fit in `quota`
+
+    candidates are ordered by last access (lru) or by hit count (lfu), pinned
+    and already evicted items are never selected
+    """
+    assert policy in EVICTION_POLICIES, f"invalid eviction policy: {policy}"
+    total = sum(item.get("size", 0) for item in items.values())
+    if total <= quota:
+        return []
+
+    key = _lru_key if policy == "lru" else _lfu_key
+    candidates = sorted(
+        (
+            id
+            for id, item in items.items()
+            if id not in pinned and not item.get("evicted") and item.get("size")
+        ),
+        key=lambda id: key(items[id]),
+    )
+    victims = []
+    for id in candidates:
+        if total <= quota:
+            break
+        victims.append(id)
+        total -= items[id]["size"]
+    return victims
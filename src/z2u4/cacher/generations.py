@@ -0,0 +1,204 @@
+import os
+import shutil
+import typing
+import uuid
+
+from .utils import clone_file
+
+
+def seed_tree(src: str, dst: str):
+    """
+    fills `dst` with hardlinks to the files of `src`, or copies where links
+    are not possible. entries already in `dst` are kept. renewals replace
+    files instead of writing into them, so the previous generation is never
+    modified through the links
+    """
+    for dirpath, dirnames, filenames in os.walk(src):
+        rel = os.path.relpath(dirpath, src)
+        target = os.path.normpath(os.path.join(dst, rel))
+        os.makedirs(target, exist_ok=True)
+        for name in dirnames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path) and not os.path.lexists(os.path.join(target, name)):
+                os.symlink(os.readlink(path), os.path.join(target, name))
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.lexists(os.path.join(target, name)):
+                continue
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), os.path.join(target, name))
+                continue
+            try:
+                os.link(path, os.path.join(target, name))
+            except OSError:
+                clone_file(path, os.path.join(target, name))
+
+
+class Generations:
+    """
+    generations of the cache item directories under `root`
+
+    a renewal stages into `<root>/.staging/<id>-<token>`, seeded from the live
+    generation once there is something to write, and publishes it as `<root>/.gens/<id>/<n>`. `<root>/<id>` is
+    a symlink swapped atomically onto the newest generation, so readers see
+    either the old or the new files, never a mix. where symlinks are not
+    available the item directory is swapped by two renames instead.
+
+    the previous `keep` generations stay on disk for `rollback`.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        keep: int = 1,
+        onRemove: typing.Optional[typing.Callable[[str, typing.Optional[int]], None]] = None,
+    ):
+        self.root = root
+        self.keep = keep
+        # called with (id, generation) once a generation is deleted, with
+        # (id, None) once every generation of `id` is
+        self.onRemove = onRemove
+
+    def live_path(self, id: str) -> str:
+        return os.path.join(self.root, id)
+
+    def gens_path(self, id: str) -> str:
+        return os.path.join(self.root, ".gens", id)
+
+    def list(self, id: str) -> typing.List[int]:
+        try:
+            names = os.listdir(self.gens_path(id))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def current(self, id: str) -> typing.Optional[int]:
+        live = self.live_path(id)
+        if not os.path.islink(live):
+            return None
+        name = os.path.basename(os.readlink(live))
+        return int(name) if name.isdigit() else None
+
+    def next(self, id: str) -> int:
+        """
+        number `publish` gives the next generation of `id`, the caller holds
+        its lock
+        """
+        if not self._symlinks():
+            return 0
+        existing = self.list(id)
+        return existing[-1] + 1 if existing else 1
+
+    def stage(self, id: str) -> str:
+        """
+        creates an empty staging directory. leftovers of crashed renewals of
+        `id` are removed, the caller holds its lock
+        """
+        staging = os.path.join(self.root, ".staging")
+        os.makedirs(staging, exist_ok=True)
+        for name in os.listdir(staging):
+            if name.startswith(f"{id}-"):
+                shutil.rmtree(os.path.join(staging, name), ignore_errors=True)
+
+        path = os.path.join(staging, f"{id}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(path)
+        return path
+
+    def seed(self, id: str, stage: str):
+        """
+        links the files of the live generation into `stage`, besides those
+        already written there
+        """
+        live = self.live_path(id)
+        if os.path.isdir(live):
+            seed_tree(os.path.realpath(live), stage)
+
+    def discard(self, stage: str):
+        shutil.rmtree(stage, ignore_errors=True)
+
+    def publish(self, id: str, stage: str) -> int:
+        """
+        moves `stage` into place as the new live generation of `id`
+        """
+        live = self.live_path(id)
+        gens = self.gens_path(id)
+        os.makedirs(gens, exist_ok=True)
+        generation = self.next(id)
+
+        if os.path.isdir(live) and not os.path.islink(live):
+            # item directory from before generations, or without symlinks
+            if not self._symlinks():
+                return self._swap_dirs(id, stage)
+            os.replace(live, os.path.join(gens, "0"))
+
+        target = os.path.join(gens, str(generation))
+        os.replace(stage, target)
+        if not self._symlinks():
+            return self._swap_dirs(id, target)
+        self._point(id, generation)
+        self.prune(id)
+        return generation
+
+    def rollback(self, id: str, generation: typing.Optional[int] = None) -> int:
+        """
+        points `id` back at `generation`, by default the one before the
+        current one
+        """
+        existing = self.list(id)
+        current = self.current(id)
+        if generation is None:
+            older = [g for g in existing if current is None or g < current]
+            if not older:
+                raise ValueError(f"Item {id} has no previous generation")
+            generation = older[-1]
+        if generation not in existing:
+            raise ValueError(f"Item {id} has no generation {generation}")
+        self._point(id, generation)
+        return generation
+
+    def prune(self, id: str):
+        current = self.current(id)
+        older = [g for g in self.list(id) if g != current]
+        for generation in older[: max(0, len(older) - self.keep)]:
+            shutil.rmtree(
+                os.path.join(self.gens_path(id), str(generation)), ignore_errors=True
+            )
+            if self.onRemove is not None:
+                self.onRemove(id, generation)
+
+    def delete(self, id: str):
+        live = self.live_path(id)
+        if os.path.islink(live):
+            os.remove(live)
+        else:
+            shutil.rmtree(live, ignore_errors=True)
+        shutil.rmtree(self.gens_path(id), ignore_errors=True)
+        if self.onRemove is not None:
+            self.onRemove(id, None)
+
+    def _point(self, id: str, generation: int):
+        tmp = os.path.join(self.root, f".{id}.{uuid.uuid4().hex[:8]}")
+        os.symlink(os.path.join(".gens", id, str(generation)), tmp)
+        os.replace(tmp, self.live_path(id))
+
+    def _swap_dirs(self, id: str, path: str) -> int:
+        live = self.live_path(id)
+        old = os.path.join(self.root, ".staging", f"{id}-old-{uuid.uuid4().hex[:8]}")
+        if os.path.isdir(live):
+            os.replace(live, old)
+        os.replace(path, live)
+        shutil.rmtree(old, ignore_errors=True)
+        return 0
+
+    _symlinksSupported: typing.Optional[bool] = None
+
+    def _symlinks(self) -> bool:
+        if Generations._symlinksSupported is None:
+            probe = os.path.join(self.root, f".probe-{uuid.uuid4().hex[:8]}")
+            try:
+                os.symlink(".", probe, target_is_directory=True)
+                os.remove(probe)
+                Generations._symlinksSupported = True
+            except (OSError, NotImplementedError):
+                Generations._symlinksSupported = False
+        return Generations._symlinksSupported
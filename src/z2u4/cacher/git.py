@@ -0,0 +1,77 @@
+import os
+import subprocess
+import typing
+
+
+class GitError(RuntimeError):
+    pass
+
+
+def run_git(*args: str, cwd: typing.Optional[str] = None) -> str:
+    proc = subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+    )
+    if proc.returncode != 0:
+        raise GitError(f"git {' '.join(args)} failed: {proc.stderr.strip()}")
+    return proc.stdout
+
+
+def ls_remote(url: str, branch: typing.Optional[str] = None) -> typing.Optional[str]:
+    """
+    returns the commit `branch` (or HEAD) points to on the remote, without
+    fetching any objects
+    """
+    ref = f"refs/heads/{branch}" if branch else "HEAD"
+    for line in run_git("ls-remote", url, ref).splitlines():
+        sha, name = line.split("\t", 1)
+        if name == ref:
+            return sha
+    return None
+
+
+def head(path: str) -> str:
+    return run_git("rev-parse", "HEAD", cwd=path).strip()
+
+
+def _depth_args(depth: int) -> typing.List[str]:
+    return [f"--depth={depth}"] if depth else []
+
+
+def clone(
+    url: str,
+    path: str,
+    branch: typing.Optional[str] = None,
+    depth: int = 1,
+    filter: typing.Optional[str] = "blob:none",
+    sparse: typing.Optional[typing.List[str]] = None,
+):
+    """
+    clones `url` into `path`, shallow when `depth` is set and partial when
+    `filter` is set. with `sparse` only the given paths are checked out
+    """
+    args = ["clone", "--no-tags", *_depth_args(depth)]
+    if filter:
+        args.append(f"--filter={filter}")
+    if branch:
+        args += ["--branch", branch, "--single-branch"]
+    if sparse:
+        args.append("--no-checkout")
+    run_git(*args, "--", url, path)
+
+    if sparse:
+        run_git("sparse-checkout", "set", "--no-cone", *sparse, cwd=path)
+        run_git("checkout", cwd=path)
+
+
+def update(path: str, branch: typing.Optional[str] = None, depth: int = 1):
+    """
+    fetches `branch` (or the remote HEAD) and moves the work tree onto it,
+    discarding local changes
+    """
+    run_git("fetch", "--no-tags", *_depth_args(depth), "origin", branch or "HEAD", cwd=path)
+    run_git("reset", "--hard", "FETCH_HEAD", cwd=path)
+    run_git("clean", "-fdq", cwd=path)
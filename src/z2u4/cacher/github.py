@@ -0,0 +1,172 @@
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+from .utils import dump_json_atomic
+
+API_URL = "https://api.github.com"
+
+
+class RateLimitError(RuntimeError):
+    def __init__(self, url: str, reset: float):
+        super().__init__(
+            f"GitHub API rate limit exceeded for {url}, resets at {time.ctime(reset)}"
+        )
+        self.reset = reset
+
+
+def api_headers() -> typing.Dict[str, str]:
+    headers = {
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    token = os.environ.get("GITHUB_TOKEN") or os.environ.get("GH_TOKEN")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+def _rate_limit_reset(response) -> typing.Optional[float]:
+    """
+    returns when a rate limited request may be retried, None if the response
+    is not rate limited
+    """
+    if response.status_code not in (403, 429):
+        return None
+    if "Retry-After" in response.headers:
+        return time.time() + float(response.headers["Retry-After"])
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        return float(response.headers.get("X-RateLimit-Reset", time.time() + 60))
+    return None
+
+
+class ApiCache:
+    """
+    ttl cache of GitHub API responses, persisted as json
+
+    fresh entries are answered without a request, stale ones are revalidated
+    with their ETag (a 304 does not count against the rate limit). concurrent
+    lookups of one key share a single request. while the API is rate limited
+    stale entries are served, and requests wait for the reset when it is at
+    most `maxWait` seconds away.
+    """
+
+    def __init__(self, path: typing.Optional[str], ttl: float = 600, maxWait: float = 60):
+        self.path = path
+        self.ttl = ttl
+        self.maxWait = maxWait
+        self.entries: typing.Dict[str, dict] = {}
+        self.blockedUntil = 0.0
+        self._lock = threading.Lock()
+        self._keyLocks: typing.Dict[str, threading.Lock] = {}
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                pass
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._keyLocks.setdefault(key, threading.Lock())
+
+    def _store(self, key: str, entry: dict):
+        with self._lock:
+            self.entries[key] = entry
+            if self.path:
+                dump_json_atomic(self.path, self.entries)
+
+    def get(self, key: str, url: str, session=None) -> typing.Any:
+        import requests
+
+        session = session or requests
+        with self._key_lock(key):
+            entry = self.entries.get(key)
+            if entry and time.time() - entry["fetched"] < self.ttl:
+                return entry["data"]
+
+            while True:
+                wait = self.blockedUntil - time.time()
+                if wait > 0:
+                    if entry:
+                        logging.info(f"GitHub API rate limited, serving stale {key}")
+                        return entry["data"]
+                    if wait > self.maxWait:
+                        raise RateLimitError(url, self.blockedUntil)
+                    time.sleep(wait)
+
+                headers = api_headers()
+                if entry and entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                response = session.get(url, headers=headers, timeout=30)
+
+                reset = _rate_limit_reset(response)
+                if reset is None:
+                    break
+                self.blockedUntil = max(self.blockedUntil, reset)
+
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                self.blockedUntil = float(response.headers.get("X-RateLimit-Reset", 0))
+
+            if response.status_code == 304 and entry:
+                entry = {**entry, "fetched": time.time()}
+            else:
+                response.raise_for_status()
+                entry = {
+                    "fetched": time.time(),
+                    "etag": response.headers.get("ETag"),
+                    "data": response.json(),
+                }
+            self._store(key, entry)
+            return entry["data"]
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def get_release(
+    owner: str,
+    repo: str,
+    tag: str = "latest",
+    session=None,
+    cache: typing.Optional[ApiCache] = None,
+) -> dict:
+    """
+    fetches the release metadata of `tag`, or of the latest release
+    """
+    path = "latest" if tag == "latest" else f"tags/{tag}"
+    cache = cache or ApiCache(None, ttl=0)
+    return cache.get(
+        f"releases/{owner}/{repo}/{tag}",
+        f"{API_URL}/repos/{owner}/{repo}/releases/{path}",
+        session=session,
+    )
+
+
+def get_gist(id: str, session=None, cache: typing.Optional[ApiCache] = None) -> dict:
+    cache = cache or ApiCache(None, ttl=0)
+    return cache.get(f"gists/{id}", f"{API_URL}/gists/{id}", session=session)
+
+
+def select_assets(
+    assets: typing.List[dict], patterns: typing.Optional[typing.List[str]]
+) -> typing.List[dict]:
+    """
+    returns the release assets whose name matches any of the glob `patterns`,
+    every asset when no pattern is given
+    """
+    if not patterns:
+        return list(assets)
+    return [
+        asset
+        for asset in assets
+        if any(fnmatch.fnmatchcase(asset["name"], pattern) for pattern in patterns)
+    ]
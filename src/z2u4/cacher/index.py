@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import typing
+
+from .utils import dump_json_atomic
+
+
+def params_key(type_: str, params: dict) -> str:
+    """
+    Returns a canonical key for a (type, params) pair.
+
+    Params are serialized with sorted keys so that two dicts that compare
+    equal always produce the same key.
+    """
+    blob = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{type_}:{hashlib.sha1(blob.encode('utf-8')).hexdigest()}"
+
+
+class CacheIndex:
+    """
+    persistent secondary index over the cacher metadata
+
+    values : meta value -> [ids]
+    params : params_key(type, meta) -> id
+    types  : type -> [ids]
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values: typing.Dict[str, typing.List[str]] = {}
+        self.params: typing.Dict[str, str] = {}
+        self.types: typing.Dict[str, typing.List[str]] = {}
+        self.ids: typing.Dict[str, typing.List[str]] = {}
+
+    def sync(self, cache: typing.Mapping[str, dict]):
+        """
+        loads the index from disk, rebuilding it when it does not cover
+        exactly the ids present in `cache`
+        """
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.values = data["values"]
+                self.params = data["params"]
+                self.types = data["types"]
+                self.ids = data["ids"]
+            except (OSError, ValueError, KeyError):
+                self.clear()
+
+        if self.ids.keys() != cache.keys():
+            self.rebuild(cache)
+
+    def rebuild(self, cache: typing.Mapping[str, dict]):
+        self.clear()
+        for id, item in cache.items():
+            self.add(id, item, save=False)
+        self.save()
+
+    def clear(self):
+        self.values = {}
+        self.params = {}
+        self.types = {}
+        self.ids = {}
+
+    def save(self):
+        dump_json_atomic(
+            self.path,
+            {
+                "values": self.values,
+                "params": self.params,
+                "types": self.types,
+                "ids": self.ids,
+            },
+        )
+
+    def add(self, id: str, item: dict, save: bool = True):
+        if id in self.ids:
+            self.discard(id, save=False)
+
+        values = [v for v in item["meta"].values() if isinstance(v, str)]
+        pkey = params_key(item["type"], item["meta"])
+
+        for value in values:
+            self.values.setdefault(value, []).append(id)
+        self.params.setdefault(pkey, id)
+        self.types.setdefault(item["type"], []).append(id)
+        self.ids[id] = [item["type"], pkey, *values]
+
+        if save:
+            self.save()
+
+    def discard(self, id: str, save: bool = True):
+        record = self.ids.pop(id, None)
+        if record is None:
+            return
+
+        type_, pkey, *values = record
+        for value in values:
+            ids = self.values.get(value, [])
+            if id in ids:
+                ids.remove(id)
+            if not ids:
+                self.values.pop(value, None)
+        ids = self.types.get(type_, [])
+        if id in ids:
+            ids.remove(id)
+        if not ids:
+            self.types.pop(type_, None)
+        if self.params.get(pkey) == id:
+            del self.params[pkey]
+            # fall back to a duplicate entry with the same params, if any
+            for other in ids:
+                if self.ids[other][1] == pkey:
+                    self.params[pkey] = other
+                    break
+
+        if save:
+            self.save()
+
+    def find_value(
+        self, value: str, type_: typing.Optional[str] = None
+    ) -> typing.Optional[str]:
+        for id in self.values.get(value, []):
+            if type_ is None or self.ids[id][0] == type_:
+                return id
+        return None
+
+    def find_params(self, type_: str, params: dict) -> typing.Optional[str]:
+        return self.params.get(params_key(type_, params))
+
+    def of_type(self, type_: str) -> typing.List[str]:
+        return list(self.types.get(type_, []))
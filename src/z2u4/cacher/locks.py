@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+import typing
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    exclusive lock shared by the threads of this process and other processes
+    through `path`, released automatically when the holding process dies
+
+    the lock is not reentrant.
+    """
+
+    def __init__(self, path: str, poll: float = 0.05):
+        self.path = path
+        self.poll = poll
+        self._lock = threading.Lock()
+        self._fd: typing.Optional[int] = None
+
+    def acquire(
+        self, blocking: bool = True, timeout: typing.Optional[float] = None
+    ) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        threadTimeout = -1 if deadline is None or not blocking else timeout
+        if not self._lock.acquire(blocking, threadTimeout):
+            return False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None and blocking and deadline is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while not _try_lock(fd):
+                    expired = deadline is not None and time.monotonic() >= deadline
+                    if not blocking or expired:
+                        os.close(fd)
+                        self._lock.release()
+                        return False
+                    time.sleep(self.poll)
+        except BaseException:
+            self._lock.release()
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        try:
+            _unlock(fd)
+        finally:
+            os.close(fd)
+            self._lock.release()
+
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
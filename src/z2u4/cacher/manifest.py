@@ -0,0 +1,120 @@
+import fnmatch
+import json
+import os
+import threading
+import typing
+
+from .utils import dump_json_atomic, hash_file
+
+
+class ManifestEntry(typing.TypedDict):
+    size: typing.Optional[int]
+    mtime: typing.Optional[int]
+    # None for a dangling symlink, which verification reports as missing
+    sha256: typing.Optional[str]
+
+
+Manifest = typing.Dict[str, ManifestEntry]
+
+# directories never listed, git keeps its own index
+SKIP_DIRS = {".git"}
+
+
+def build_manifest(root: str, previous: typing.Optional[Manifest] = None) -> Manifest:
+    """
+    relative posix path -> size, mtime and sha256 of every file under `root`,
+    dangling symlinks included. digests of files whose size and mtime match
+    `previous` are reused
+    """
+    previous = previous or {}
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        for name in sorted(filenames):
+            file = os.path.join(dirpath, name)
+            rel = os.path.relpath(file, root).replace(os.sep, "/")
+            try:
+                st = os.stat(file)
+            except FileNotFoundError:
+                # dangling symlink, kept so it is not mistaken for a removal
+                manifest[rel] = {"size": None, "mtime": None, "sha256": None}
+                continue
+            old = previous.get(rel)
+            if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime_ns:
+                digest = old["sha256"]
+            else:
+                digest = hash_file(file)
+            manifest[rel] = {"size": st.st_size, "mtime": st.st_mtime_ns, "sha256": digest}
+    return manifest
+
+
+def match(manifest: Manifest, pattern: str) -> typing.List[str]:
+    """
+    paths of `manifest` matching `pattern`, tried in order as an exact path,
+    a glob over paths (over basenames too when it has no "/") and a basename
+    """
+    pattern = pattern.replace(os.sep, "/").strip("/")
+    if pattern in manifest:
+        return [pattern]
+    if any(c in pattern for c in "*?["):
+        if "/" in pattern:
+            return [p for p in manifest if fnmatch.fnmatchcase(p, pattern)]
+        return [
+            p
+            for p in manifest
+            if fnmatch.fnmatchcase(p, pattern)
+            or fnmatch.fnmatchcase(p.rsplit("/", 1)[-1], pattern)
+        ]
+    return [p for p in manifest if p.rsplit("/", 1)[-1] == pattern]
+
+
+class Manifests:
+    """
+    one json manifest per item, read back from memory until the file changes
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._memo: typing.Dict[str, typing.Tuple[int, Manifest]] = {}
+
+    def path(self, id: str) -> str:
+        return os.path.join(self.root, f"{id}.json")
+
+    def get(self, id: str) -> typing.Optional[Manifest]:
+        path = self.path(id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            memo = self._memo.get(id)
+        if memo and memo[0] == mtime:
+            return memo[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._memo[id] = (mtime, manifest)
+        return manifest
+
+    def write(self, id: str, manifest: Manifest):
+        dump_json_atomic(self.path(id), manifest)
+
+    def delete(self, id: str):
+        with self._lock:
+            self._memo.pop(id, None)
+        try:
+            os.remove(self.path(id))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.root, name))
@@ -0,0 +1,190 @@
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import dump_json_atomic
+
+
+class RefreshScheduler:
+    """
+    renews cache items shortly before they expire
+
+    items are kept in a priority queue ordered by
+    `lastChecked + checkInterval - lead - jitter`, and at most `workers` renewals
+    run at the same time. the store is rescanned every `rescan` seconds to pick
+    up items cached or renewed by other processes.
+    """
+
+    def __init__(
+        self,
+        cacher=None,
+        lead: float = 300,
+        jitter: float = 60,
+        workers: int = 4,
+        rescan: float = 60,
+        retry: float = 300,
+        statePath: typing.Optional[str] = None,
+    ):
+        if cacher is None:
+            from .core import Cacher as cacher
+        self.cacher = cacher
+        self.lead = lead
+        self.jitter = jitter
+        self.workers = max(1, workers)
+        self.rescan = rescan
+        self.retry = retry
+        self.statePath = statePath
+        self.queue: typing.List[typing.Tuple[float, str]] = []
+        self.running: typing.Dict[str, float] = {}
+        self.failed: typing.Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def due(self, item: dict) -> typing.Optional[float]:
+        if item.get("checkInterval") is None or item.get("evicted"):
+            return None
+        interval = item["checkInterval"]
+        # lead and jitter are clamped so a renewed item is never due right away
+        lead = min(self.lead, interval / 2)
+        jitter = random.uniform(0, min(self.jitter, interval / 4))
+        return item["lastChecked"] + interval - lead - jitter
+
+    def scan(self):
+        """
+        rebuilds the queue from the store, skipping items being renewed
+        """
+        with self._lock:
+            running = set(self.running)
+        self.cacher.CACHE.refresh(exclude=running)
+
+        queue = []
+        for id, item in self.cacher.iter_cache():
+            if id in running:
+                continue
+            due = self.due(item)
+            if due is not None:
+                queue.append((due, id))
+        heapq.heapify(queue)
+
+        with self._lock:
+            self.queue = queue
+
+    def snapshot(self) -> typing.List[dict]:
+        with self._lock:
+            running = dict(self.running)
+            queue = sorted(self.queue)
+            failed = dict(self.failed)
+        rows = [{"id": id, "due": None, "running": since} for id, since in running.items()]
+        rows += [
+            {"id": id, "due": due, "running": None, "error": failed.get(id)}
+            for due, id in queue
+        ]
+        return rows
+
+    def _save_state(self):
+        if not self.statePath:
+            return
+        dump_json_atomic(
+            self.statePath,
+            {"pid": os.getpid(), "updated": time.time(), "queue": self.snapshot()},
+        )
+
+    def _renew(self, id: str):
+        due = None
+        error = None
+        try:
+            self.cacher.renew(id)
+            due = self.due(self.cacher.CACHE[id])
+            with self._lock:
+                running = set(self.running)
+            self.cacher.evict(exclude=running)
+        except Exception as e:  # noqa
+            logging.exception(f"Failed to renew {id}")
+            error = str(e)
+            due = time.time() + self.retry
+        finally:
+            with self._lock:
+                if error is None:
+                    self.failed.pop(id, None)
+                else:
+                    self.failed[id] = error
+                self.running.pop(id, None)
+                if due is not None:
+                    heapq.heappush(self.queue, (due, id))
+            self._wake.set()
+
+    def run(self, once: bool = False):
+        """
+        runs the scheduler in the current thread until `stop()` is called,
+        or until nothing is due anymore when `once` is set
+        """
+        self.scan()
+        nextScan = time.time() + self.rescan
+        started = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not self._stop.is_set():
+                now = time.time()
+                if now >= nextScan:
+                    self.scan()
+                    nextScan = now + self.rescan
+
+                with self._lock:
+                    while (
+                        self.queue
+                        and self.queue[0][0] <= (started if once else now)
+                        and len(self.running) < self.workers
+                    ):
+                        _, id = heapq.heappop(self.queue)
+                        if id in self.running:
+                            continue
+                        self.running[id] = now
+                        pool.submit(self._renew, id)
+                    idle = not self.running
+                    nextDue = self.queue[0][0] if self.queue else None
+                self._save_state()
+
+                if once and idle and (nextDue is None or nextDue > started):
+                    break
+
+                timeout = nextScan - now
+                if nextDue is not None:
+                    timeout = min(timeout, nextDue - now)
+                self._wake.wait(max(0.0, timeout))
+                self._wake.clear()
+
+        self._save_state()
+
+    def start(self) -> threading.Thread:
+        """
+        runs the scheduler in a daemon thread of the current process
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="cacher-scheduler", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def load_state(statePath: str) -> typing.Optional[dict]:
+    try:
+        with open(statePath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
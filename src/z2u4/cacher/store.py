@@ -0,0 +1,600 @@
+import abc
+import contextlib
+import json
+from collections.abc import MutableMapping
+import os
+import sqlite3
+import threading
+import typing
+
+from .index import CacheIndex, params_key
+from .locks import FileLock
+from .utils import dump_json_atomic
+
+BACKENDS = ["sqlite", "json"]
+
+
+class JsonDict(dict):
+    """
+    dict persisted to a json file, saved on every top level mutation
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    super().update(json.load(f))
+            except ValueError:
+                pass
+
+    def _save(self):
+        dump_json_atomic(self.path, dict(self))
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._save()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._save()
+
+    def pop(self, *args):
+        res = super().pop(*args)
+        self._save()
+        return res
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._save()
+
+    def clear(self):
+        super().clear()
+        self._save()
+
+
+class MetaStore(MutableMapping):
+    """
+    metadata backend of the cacher, mapping ids to cache items
+
+    setting or deleting an item is written immediately. items mutated in place
+    are persisted with `save(id)`, which inside `batch()` is deferred and
+    committed together when the outermost batch exits.
+    """
+
+    path: str
+    index: typing.Any
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._pending: typing.Set[str] = set()
+
+    def save(self, id: str, now: bool = False):
+        """
+        persists the in place changes of `id`. `now` writes it even inside a
+        batch, for changes that must be on disk before an item lock is released
+        """
+        with self._lock:
+            if self._depth and not now:
+                self._pending.add(id)
+                return
+            self._pending.discard(id)
+        self._write([id])
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self._lock:
+            self._depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if self._depth:
+                    return
+                pending = [id for id in self._pending if id in self]
+                self._pending = set()
+            if pending:
+                self._write(pending)
+
+    def _save(self):
+        """
+        persists every item, kept for callers of the old DictWithAutosave api
+        """
+        self._write(list(self))
+
+    @abc.abstractmethod
+    def _write(self, ids: typing.List[str]):
+        """
+        persists the loaded items `ids`
+        """
+
+    def refresh(self, exclude: typing.Collection[str] = ()):
+        """
+        drops loaded items, except `exclude`, so they are read again from disk
+        """
+
+    def sync(self):
+        """
+        picks up items added or removed by other processes, keeping the
+        loaded items as they are
+        """
+
+    @abc.abstractmethod
+    def reload(self, id: str) -> dict:
+        """
+        updates the loaded item `id` in place from disk and returns it,
+        raises KeyError if another process removed it
+        """
+
+    @abc.abstractmethod
+    def total_size(self) -> int:
+        """
+        sum of the sizes recorded on disk for all items, kept up to date by
+        the writes instead of scanning the items
+        """
+
+    def close(self):
+        pass
+
+
+def _sum_sizes(items: typing.Mapping[str, dict]) -> int:
+    return sum(item.get("size") or 0 for item in items.values())
+
+
+def _file_key(path: str) -> tuple:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class JsonStore(MetaStore):
+    """
+    the original cache.json backend, every write rewrites the whole file
+
+    writes hold a file lock and merge into the current file, so items written
+    by other processes are kept
+    """
+
+    def __init__(self, path: str, indexPath: str):
+        super().__init__()
+        self.path = path
+        self.index = CacheIndex(indexPath)
+        self.fileLock = FileLock(path + ".lock")
+        self._data: typing.Optional[typing.Dict[str, dict]] = None
+        # (mtime and size of the file, total size of its items)
+        self._total: typing.Optional[typing.Tuple[tuple, int]] = None
+
+    @property
+    def data(self) -> typing.Dict[str, dict]:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    data = JsonDict(self.path)
+                    self.index.sync(data)
+                    self._data = dict(data)
+        return self._data
+
+    def __getitem__(self, id: str) -> dict:
+        return self.data[id]
+
+    def __iter__(self):
+        return iter(list(self.data))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, id) -> bool:
+        return id in self.data
+
+    def __setitem__(self, id: str, item: dict):
+        self._commit(changed={id: item})
+
+    def __delitem__(self, id: str):
+        if id not in self.data:
+            raise KeyError(id)
+        self._commit(deleted=[id])
+
+    def clear(self):
+        self._commit(clear=True)
+
+    def _write(self, ids: typing.List[str]):
+        with self._lock:
+            self._commit(changed={id: self.data[id] for id in ids if id in self.data})
+
+    def _commit(
+        self,
+        changed: typing.Optional[typing.Dict[str, dict]] = None,
+        deleted: typing.Collection[str] = (),
+        clear: bool = False,
+    ):
+        """
+        applies `changed` and `deleted` to the file on disk, picking up the
+        items other processes added or removed meanwhile
+        """
+        changed = changed or {}
+        with self._lock, self.fileLock:
+            data = self.data
+            disk = {} if clear else dict(JsonDict(self.path))
+            for id in deleted:
+                disk.pop(id, None)
+            disk.update(changed)
+
+            for id in [id for id in data if id not in disk]:
+                del data[id]
+                self.index.discard(id, save=False)
+            for id, item in disk.items():
+                if id in changed or id not in data:
+                    data[id] = item
+                    self.index.add(id, item, save=False)
+
+            if changed or deleted or clear:
+                dump_json_atomic(self.path, disk)
+                self._total = (_file_key(self.path), _sum_sizes(disk))
+            self.index.save()
+
+    def sync(self):
+        self._commit()
+
+    def total_size(self) -> int:
+        """
+        recounted only when another process rewrote the file
+        """
+        try:
+            key = _file_key(self.path)
+        except FileNotFoundError:
+            return 0
+        with self._lock:
+            if self._total is None or self._total[0] != key:
+                self._total = (key, _sum_sizes(JsonDict(self.path)))
+            return self._total[1]
+
+    def reload(self, id: str) -> dict:
+        with self._lock:
+            disk = JsonDict(self.path)
+            if id not in disk:
+                self.data.pop(id, None)
+                raise KeyError(id)
+            item = self.data.get(id)
+            if item is None:
+                item = self.data[id] = disk[id]
+            elif item != disk[id]:
+                item.clear()
+                item.update(disk[id])
+            return item
+
+    def migrate(self, dbPath: str):
+        """
+        imports the items of a sqlite store and moves the database aside
+        """
+        source = SqliteStore(dbPath)
+        try:
+            items = {id: source[id] for id in source}
+        finally:
+            source.close()
+        with self._lock, self.fileLock:
+            disk = dict(JsonDict(self.path))
+            for id, item in items.items():
+                disk.setdefault(id, item)
+            dump_json_atomic(self.path, disk)
+            self._data = None
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(dbPath + suffix):
+                os.replace(dbPath + suffix, dbPath + ".migrated" + suffix)
+
+    def refresh(self, exclude: typing.Collection[str] = ()):
+        with self._lock:
+            if self._data is None:
+                return
+            data = dict(JsonDict(self.path))
+            for id in exclude:
+                if id in self._data:
+                    data[id] = self._data[id]
+            self._data = data
+            self.index.sync(data)
+
+
+class SqliteIndex:
+    """
+    CacheIndex api answered by the tables of a SqliteStore
+    """
+
+    def __init__(self, store: "SqliteStore"):
+        self.store = store
+
+    def sync(self, cache=None):
+        pass
+
+    def save(self):
+        pass
+
+    def add(self, id: str, item: dict, save: bool = True):
+        with self.store.transaction() as conn:
+            self._add(conn, id, item)
+
+    def _add(self, conn: sqlite3.Connection, id: str, item: dict):
+        self._discard(conn, id)
+        conn.executemany(
+            "INSERT INTO meta_values (value, id) VALUES (?, ?)",
+            [(v, id) for v in item["meta"].values() if isinstance(v, str)],
+        )
+        conn.execute(
+            "INSERT INTO meta_params (key, id) VALUES (?, ?)",
+            (params_key(item["type"], item["meta"]), id),
+        )
+
+    def discard(self, id: str, save: bool = True):
+        with self.store.transaction() as conn:
+            self._discard(conn, id)
+
+    def _discard(self, conn: sqlite3.Connection, id: str):
+        conn.execute("DELETE FROM meta_values WHERE id = ?", (id,))
+        conn.execute("DELETE FROM meta_params WHERE id = ?", (id,))
+
+    def clear(self):
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM meta_values")
+            conn.execute("DELETE FROM meta_params")
+
+    def find_value(
+        self, value: str, type_: typing.Optional[str] = None
+    ) -> typing.Optional[str]:
+        query = (
+            "SELECT v.id FROM meta_values v JOIN items i ON i.id = v.id"
+            " WHERE v.value = ?"
+        )
+        args = [value]
+        if type_ is not None:
+            query += " AND i.type = ?"
+            args.append(type_)
+        rows = self.store.query(query + " ORDER BY v.rowid LIMIT 1", args)
+        return rows[0][0] if rows else None
+
+    def find_params(self, type_: str, params: dict) -> typing.Optional[str]:
+        rows = self.store.query(
+            "SELECT id FROM meta_params WHERE key = ? ORDER BY rowid LIMIT 1",
+            (params_key(type_, params),),
+        )
+        return rows[0][0] if rows else None
+
+    def of_type(self, type_: str) -> typing.List[str]:
+        rows = self.store.query(
+            "SELECT id FROM items WHERE type = ? ORDER BY rowid", (type_,)
+        )
+        return [row[0] for row in rows]
+
+
+class SqliteStore(MetaStore):
+    """
+    embedded sqlite backend, items are written per record and parsed lazily
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS items (
+        id TEXT PRIMARY KEY,
+        type TEXT NOT NULL,
+        data TEXT NOT NULL,
+        size INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS items_type ON items (type);
+    CREATE TABLE IF NOT EXISTS meta_values (value TEXT NOT NULL, id TEXT NOT NULL);
+    CREATE INDEX IF NOT EXISTS meta_values_value ON meta_values (value);
+    CREATE INDEX IF NOT EXISTS meta_values_id ON meta_values (id);
+    CREATE TABLE IF NOT EXISTS meta_params (key TEXT NOT NULL, id TEXT NOT NULL);
+    CREATE INDEX IF NOT EXISTS meta_params_key ON meta_params (key);
+    CREATE INDEX IF NOT EXISTS meta_params_id ON meta_params (id);
+    CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    # keep totals.size equal to the sum of items.size on every write
+    TRIGGERS = [
+        """CREATE TRIGGER IF NOT EXISTS items_size_insert AFTER INSERT ON items
+        BEGIN UPDATE totals SET value = value + NEW.size WHERE name = 'size'; END""",
+        """CREATE TRIGGER IF NOT EXISTS items_size_update AFTER UPDATE OF size ON items
+        BEGIN UPDATE totals SET value = value - OLD.size + NEW.size WHERE name = 'size'; END""",
+        """CREATE TRIGGER IF NOT EXISTS items_size_delete AFTER DELETE ON items
+        BEGIN UPDATE totals SET value = value - OLD.size WHERE name = 'size'; END""",
+    ]
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.index = SqliteIndex(self)
+        self._conn: typing.Optional[sqlite3.Connection] = None
+        self._items: typing.Dict[str, dict] = {}
+        self._version: typing.Optional[int] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    conn = sqlite3.connect(
+                        self.path, isolation_level=None, check_same_thread=False
+                    )
+                    conn.execute("PRAGMA busy_timeout = 10000")
+                    conn.execute("PRAGMA journal_mode = WAL")
+                    conn.executescript(self.SCHEMA)
+                    self._conn = conn
+                    with self.transaction() as conn:
+                        self._upgrade(conn)
+        return self._conn
+
+    def _upgrade(self, conn: sqlite3.Connection):
+        """
+        adds the size column to databases from before it was kept, and the
+        running total of sizes
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(items)")}
+        if "size" not in columns:
+            conn.execute("ALTER TABLE items ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            conn.execute("UPDATE items SET size = COALESCE(json_extract(data, '$.size'), 0)")
+        conn.execute(
+            "INSERT OR IGNORE INTO totals (name, value)"
+            " SELECT 'size', COALESCE(SUM(size), 0) FROM items"
+        )
+        for trigger in self.TRIGGERS:
+            conn.execute(trigger)
+
+    def query(self, sql: str, args: typing.Sequence = ()) -> typing.List[tuple]:
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _forget_removed(self):
+        """
+        drops loaded items that other connections removed since the last call,
+        noticed through sqlite's data_version
+        """
+        with self._lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return
+            self._version = version
+            if self._items:
+                ids = {row[0] for row in self.conn.execute("SELECT id FROM items")}
+                for id in [id for id in self._items if id not in ids]:
+                    del self._items[id]
+
+    def __getitem__(self, id: str) -> dict:
+        self._forget_removed()
+        item = self._items.get(id)
+        if item is not None:
+            return item
+        rows = self.query("SELECT data FROM items WHERE id = ?", (id,))
+        if not rows:
+            raise KeyError(id)
+        return self._items.setdefault(id, json.loads(rows[0][0]))
+
+    def __iter__(self):
+        rows = self.query("SELECT id FROM items ORDER BY rowid")
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        return self.query("SELECT COUNT(*) FROM items")[0][0]
+
+    def __contains__(self, id) -> bool:
+        self._forget_removed()
+        if id in self._items:
+            return True
+        return bool(self.query("SELECT 1 FROM items WHERE id = ?", (id,)))
+
+    def __setitem__(self, id: str, item: dict):
+        with self.transaction() as conn:
+            self._upsert(conn, id, item)
+            self.index._add(conn, id, item)
+        self._items[id] = item
+
+    def __delitem__(self, id: str):
+        with self.transaction() as conn:
+            if conn.execute("DELETE FROM items WHERE id = ?", (id,)).rowcount == 0:
+                raise KeyError(id)
+            self.index._discard(conn, id)
+        self._items.pop(id, None)
+
+    def clear(self):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM items")
+            conn.execute("DELETE FROM meta_values")
+            conn.execute("DELETE FROM meta_params")
+        self._items = {}
+
+    def _upsert(self, conn: sqlite3.Connection, id: str, item: dict):
+        conn.execute(
+            "INSERT INTO items (id, type, data, size) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET"
+            " type = excluded.type, data = excluded.data, size = excluded.size",
+            (id, item["type"], json.dumps(item), item.get("size") or 0),
+        )
+
+    def total_size(self) -> int:
+        return self.query("SELECT value FROM totals WHERE name = 'size'")[0][0]
+
+    def _write(self, ids: typing.List[str]):
+        with self.transaction() as conn:
+            for id in ids:
+                item = self._items.get(id)
+                if item is not None:
+                    self._upsert(conn, id, item)
+
+    def refresh(self, exclude: typing.Collection[str] = ()):
+        with self._lock:
+            self._items = {id: self._items[id] for id in exclude if id in self._items}
+
+    def sync(self):
+        with self._lock:
+            ids = set(self)
+            for id in [id for id in self._items if id not in ids]:
+                del self._items[id]
+
+    def reload(self, id: str) -> dict:
+        rows = self.query("SELECT data FROM items WHERE id = ?", (id,))
+        with self._lock:
+            if not rows:
+                self._items.pop(id, None)
+                raise KeyError(id)
+            fresh = json.loads(rows[0][0])
+            item = self._items.get(id)
+            if item is None:
+                item = self._items[id] = fresh
+            elif item != fresh:
+                item.clear()
+                item.update(fresh)
+            return item
+
+    def migrate(self, jsonPath: str):
+        """
+        imports the items of a legacy cache.json and moves the file aside
+        """
+        data = JsonDict(jsonPath)
+        with self.transaction() as conn:
+            for id, item in data.items():
+                if conn.execute("SELECT 1 FROM items WHERE id = ?", (id,)).fetchone():
+                    continue
+                self._upsert(conn, id, item)
+                self.index._add(conn, id, item)
+        os.replace(jsonPath, jsonPath + ".migrated")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def open_store(root: str, backend: str = "sqlite") -> MetaStore:
+    assert backend in BACKENDS, f"invalid backend: {backend}"
+    jsonPath = os.path.join(root, "cache.json")
+    dbPath = os.path.join(root, "cache.db")
+    if backend == "json":
+        store = JsonStore(jsonPath, os.path.join(root, "index.json"))
+        if os.path.exists(dbPath):
+            store.migrate(dbPath)
+        return store
+
+    store = SqliteStore(dbPath)
+    if os.path.exists(jsonPath):
+        store.migrate(jsonPath)
+        try:
+            os.remove(os.path.join(root, "index.json"))
+        except FileNotFoundError:
+            pass
+    return store
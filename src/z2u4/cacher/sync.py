@@ -0,0 +1,144 @@
+import os
+import shutil
+import stat
+import typing
+
+from .manifest import Manifest
+from .utils import clone_file, hash_file
+
+
+class SyncStats(typing.TypedDict):
+    copied: int
+    deleted: int
+    unchanged: int
+
+
+def _scan(root: str, rel: str = "") -> typing.Dict[str, os.stat_result]:
+    """
+    relative path -> lstat of every entry under `root`, directories included
+    """
+    entries = {}
+    with os.scandir(os.path.join(root, rel)) as it:
+        for entry in it:
+            path = os.path.join(rel, entry.name)
+            st = entry.stat(follow_symlinks=False)
+            entries[path] = st
+            if stat.S_ISDIR(st.st_mode):
+                entries.update(_scan(root, path))
+    return entries
+
+
+def _same_type(a: os.stat_result, b: typing.Optional[os.stat_result]) -> bool:
+    return b is not None and stat.S_IFMT(a.st_mode) == stat.S_IFMT(b.st_mode)
+
+
+def _same(
+    src: str,
+    srcStat: os.stat_result,
+    dst: str,
+    dstStat: typing.Optional[os.stat_result],
+    useHash: bool,
+) -> bool:
+    if not _same_type(srcStat, dstStat):
+        return False
+    if stat.S_ISLNK(srcStat.st_mode):
+        return os.readlink(src) == os.readlink(dst)
+    if srcStat.st_size != dstStat.st_size:
+        return False
+    if useHash:
+        return hash_file(src) == hash_file(dst)
+    return srcStat.st_mtime_ns == dstStat.st_mtime_ns
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def sync_tree(
+    src: str, dst: str, useHash: bool = False, link: bool = False
+) -> SyncStats:
+    """
+    makes `dst` mirror `src`, copying only files whose size or mtime (or hash,
+    with `useHash`) differ and deleting entries that no longer exist in `src`.
+    a file `src` is mirrored as `dst/<basename>`.
+
+    changed files are written aside and renamed into place, as reflinks where
+    the filesystem supports them, or hardlinks to the source with `link`.
+    """
+    os.makedirs(dst, exist_ok=True)
+    if os.path.isdir(src):
+        srcRoot, wanted = src, _scan(src)
+    else:
+        srcRoot = os.path.dirname(src)
+        wanted = {os.path.basename(src): os.lstat(src)}
+    existing = _scan(dst)
+    stats: SyncStats = {"copied": 0, "deleted": 0, "unchanged": 0}
+
+    # deepest first, so directories are emptied before they are removed
+    for rel in sorted(existing, key=len, reverse=True):
+        srcStat = wanted.get(rel)
+        if srcStat is None or not _same_type(srcStat, existing[rel]):
+            if os.path.lexists(os.path.join(dst, rel)):
+                _remove(os.path.join(dst, rel))
+            del existing[rel]
+            stats["deleted"] += 1
+
+    for rel in sorted(wanted):
+        srcStat = wanted[rel]
+        source = os.path.join(srcRoot, rel)
+        target = os.path.join(dst, rel)
+        if stat.S_ISDIR(srcStat.st_mode):
+            os.makedirs(target, exist_ok=True)
+            continue
+        if _same(source, srcStat, target, existing.get(rel), useHash):
+            stats["unchanged"] += 1
+            continue
+
+        tmp = target + ".sync-tmp"
+        if stat.S_ISLNK(srcStat.st_mode):
+            os.symlink(os.readlink(source), tmp)
+        else:
+            try:
+                if not link:
+                    raise OSError
+                os.link(source, tmp)
+            except OSError:
+                clone_file(source, tmp)
+                shutil.copystat(source, tmp)
+        os.replace(tmp, target)
+        stats["copied"] += 1
+
+    return stats
+
+
+def matches_manifest(src: str, manifest: Manifest, useHash: bool = False) -> bool:
+    """
+    whether `sync_tree(src, ...)` would leave the tree recorded by `manifest`
+    as it is, compared like `sync_tree` does without touching that tree.
+    symlinks in `src` always count as changes, manifests do not record them
+    """
+    if os.path.isdir(src):
+        srcRoot, wanted = src, _scan(src)
+    else:
+        srcRoot = os.path.dirname(src)
+        wanted = {os.path.basename(src): os.lstat(src)}
+    files = {
+        rel.replace(os.sep, "/"): st
+        for rel, st in wanted.items()
+        if not stat.S_ISDIR(st.st_mode)
+    }
+    if files.keys() != manifest.keys():
+        return False
+    for rel, st in files.items():
+        entry = manifest[rel]
+        if stat.S_ISLNK(st.st_mode) or st.st_size != entry["size"]:
+            return False
+        if useHash:
+            if hash_file(os.path.join(srcRoot, rel)) != entry["sha256"]:
+                return False
+        elif st.st_mtime_ns != entry["mtime"]:
+            return False
+    return True
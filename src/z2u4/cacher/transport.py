@@ -0,0 +1,113 @@
+import typing
+import weakref
+
+
+class OfflineError(ConnectionError):
+    pass
+
+
+class Transport:
+    """
+    pooled http session shared by every renewal
+
+    connections are kept alive per host, with at most `perHost` of them open
+    to one host at a time (further requests wait for a free connection).
+    idempotent requests are retried on connection errors and 429/5xx responses
+    with exponential backoff. in `offline` mode every request fails with
+    OfflineError.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff: float = 0.5,
+        perHost: int = 4,
+        proxy: typing.Optional[str] = None,
+        offline: bool = False,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.perHost = perHost
+        self.proxy = proxy
+        self.offline = offline
+        self._session = None
+        self._aclients = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(
+                total=self.retries,
+                connect=self.retries,
+                read=self.retries,
+                status=self.retries,
+                backoff_factor=self.backoff,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET", "HEAD"],
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=self.perHost,
+                pool_block=True,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if self.proxy:
+                session.proxies = {"http": self.proxy, "https": self.proxy}
+            self._session = session
+        return self._session
+
+    def get(self, url: str, **kwargs):
+        if self.offline:
+            raise OfflineError(f"offline, not fetching {url}")
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def aclient(self):
+        """
+        httpx.AsyncClient of the running event loop, None when httpx is not
+        installed
+        """
+        import asyncio
+
+        try:
+            import httpx
+        except ImportError:
+            return None
+        if self.offline:
+            raise OfflineError("offline, not opening an async client")
+
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                transport=httpx.AsyncHTTPTransport(
+                    retries=self.retries, proxy=self.proxy
+                ),
+            )
+            self._aclients[loop] = client
+        return client
+
+    async def aclose(self):
+        import asyncio
+
+        client = self._aclients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
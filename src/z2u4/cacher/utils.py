@@ -1,4 +1,10 @@
+import hashlib
+import json
+import os
 import re
+import shutil
+import tempfile
+from urllib.parse import urlparse
 
 
 def extract_githuburl_params(url: str) -> dict:
@@ -70,3 +76,115 @@ def extract_githubrelease_params(url: str) -> dict:
 def convert_githubrelease_to_latest(url: str) -> str:
     params = extract_githubrelease_params(url)
     return f"https://github.com/{params['owner']}/{params['repo']}/releases/latest"
+
+
+def dump_json_atomic(path: str, data) -> None:
+    """
+    Writes `data` as json to a temp file next to `path` and renames it into place,
+    so readers never observe a partially written file.
+    """
+    dirname = os.path.dirname(path) or "."
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def get_item_host(item: dict) -> str:
+    """
+    Returns the network host a cache item renews from, or "local" for items
+    that do not touch the network.
+    """
+    url = item["meta"].get("url")
+    if item["type"] == "localTarget" or not url:
+        return "local"
+    return urlparse(url).netloc or "local"
+
+
+def hash_file(path: str, algo: str = "sha256", chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.new(algo)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# linux ioctl to share extents between files (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+
+def clone_file(src: str, dst: str) -> None:
+    """
+    Copies `src` to `dst`, as a copy-on-write reflink when the filesystem
+    supports it, with an in-kernel copy_file_range where available and as a
+    regular copy otherwise.
+    """
+    try:
+        import fcntl
+
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return
+    except (ImportError, OSError):
+        pass
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                infd, outfd = fsrc.fileno(), fdst.fileno()
+                remaining = os.fstat(infd).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(infd, outfd, remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining <= 0:
+                shutil.copystat(src, dst)
+                return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size) -> int:
+    """
+    Parses a byte count given as an int or a string like "500M" or "10G".
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", str(size), re.I)
+    if not match:
+        raise ValueError(f"invalid size: {size}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def tree_size(path: str) -> int:
+    """
+    Returns the disk usage of the files under `path`, counting hardlinked
+    files once and symlinks by their own size.
+    """
+    if not os.path.exists(path):
+        return 0
+    if not os.path.isdir(path):
+        return os.lstat(path).st_size
+    seen = set()
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
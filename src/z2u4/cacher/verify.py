@@ -0,0 +1,126 @@
+import hashlib
+import mmap
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+from . import archive
+from .manifest import SKIP_DIRS, Manifest
+
+# bytes hashed per update, slices of the mapping are not copied
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+class VerifyReport(typing.TypedDict):
+    missing: typing.List[str]
+    extra: typing.List[str]
+    modified: typing.List[str]
+
+
+def hash_mmap(path: str, algo: str = "sha256") -> str:
+    """
+    hashes `path` through a read only memory mapping, chunk by chunk
+    """
+    hasher = hashlib.new(algo)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hasher.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for offset in range(0, len(view), HASH_CHUNK):
+                    hasher.update(view[offset : offset + HASH_CHUNK])
+            finally:
+                view.release()
+    return hasher.hexdigest()
+
+
+def _hash_job(job: typing.Tuple[str, typing.Optional[str]]) -> typing.Optional[str]:
+    """
+    digest of a file, or of an archive member when the job names one.
+    None when it cannot be read
+    """
+    path, member = job
+    try:
+        if member is None:
+            return hash_mmap(path)
+        hasher = hashlib.sha256()
+        with archive.Archive(path) as packed, packed.open(member) as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+
+
+def _listing(root: str) -> typing.Tuple[typing.List[str], typing.Optional[str]]:
+    """
+    files of an item directory and the archive path when it is compressed
+    """
+    if archive.is_packed(root):
+        path = os.path.join(root, archive.ARCHIVE_NAME)
+        try:
+            with archive.Archive(path) as packed:
+                return packed.names(), path
+        except (OSError, ValueError):
+            # an unreadable archive has every file missing
+            return [], path
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for name in filenames:
+            # dangling symlinks are listed, their hash fails as missing
+            file = os.path.join(dirpath, name)
+            files.append(os.path.relpath(file, root).replace(os.sep, "/"))
+    return files, None
+
+
+def verify_trees(
+    trees: typing.Dict[str, typing.Tuple[str, Manifest]],
+    workers: typing.Optional[int] = None,
+) -> typing.Dict[str, VerifyReport]:
+    """
+    compares item directories against their manifests, `trees` maps ids to
+    (directory, manifest). the files of every item are hashed in a single
+    process pool so large caches are bound by the disk, not one core
+    """
+    reports: typing.Dict[str, VerifyReport] = {}
+    jobs = []
+    for id, (root, manifest) in trees.items():
+        files, packed = _listing(root)
+        present = set(files)
+        reports[id] = {
+            "missing": sorted(set(manifest) - present),
+            "extra": sorted(present - set(manifest)),
+            "modified": [],
+        }
+        for rel in sorted(present & set(manifest)):
+            if packed:
+                job = (packed, rel)
+            else:
+                job = (os.path.join(root, *rel.split("/")), None)
+            jobs.append((id, rel, manifest[rel]["sha256"], job))
+
+    pool = None
+    if workers != 1 and len(jobs) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        hashJobs = [job for *_, job in jobs]
+        if pool is None:
+            digests = map(_hash_job, hashJobs)
+        else:
+            chunks = 4 * (workers or os.cpu_count() or 1)
+            digests = pool.map(_hash_job, hashJobs, chunksize=max(1, len(jobs) // chunks))
+        for (id, rel, expected, _), digest in zip(jobs, digests):
+            if digest is None:
+                reports[id]["missing"].append(rel)
+            elif digest != expected:
+                reports[id]["modified"].append(rel)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for report in reports.values():
+        report["missing"].sort()
+    return reports
@@ -1,65 +1,245 @@
+import os
 import re
 import time
 import typing
 from masscode.direct import MasscodeApi
 from masscode import Models
+from .cache import SnippetCache
+
+USRPATH = os.path.join(os.path.expanduser("~"), ".z2u4", "kvstore")
+
+
+class PartialWriteError(Exception):
+    """
+    raised by batch writes once every key was tried, `failed` maps the keys
+    that could not be written to their errors
+    """
+
+    def __init__(self, failed : typing.Dict[str, Exception]):
+        super().__init__(f"Failed to write {', '.join(failed)}")
+        self.failed = failed
+
+
 class _Kvstore:
-    def get(self, key : str):
-        snippet = None
-        try:
-            snippet = MasscodeApi.get_snippet(key)
-        except Exception:
-            snippet = MasscodeApi.snippets(params={"name_like" : key})
-            if len(snippet) == 0:
-                return None
-            snippet = snippet[0]
-        if snippet is None:
+    """
+    string values kept as masscode snippets, read through a local cache.
+    `ttl` is how long a cached snippet is served without asking masscode,
+    None serves it until `prefetch` or a write replaces it. writes always
+    start from the snippet in masscode, so edits made there are not
+    overwritten by a cached copy
+    """
+
+    def __init__(self, ttl : typing.Optional[float] = 300):
+        self.ttl = ttl
+        self._cache = None
+
+    @property
+    def cache(self) -> SnippetCache:
+        if self._cache is None:
+            self._cache = SnippetCache(os.path.join(USRPATH, "cache.json"), self.ttl)
+        return self._cache
+
+    def snippet(self, key : str) -> typing.Optional[Models.Snippet]:
+        hit, snippet = self.cache.lookup(key)
+        if hit:
+            return snippet
+        return self._fetch(key)
+
+    def _fetch(self, key : str) -> typing.Optional[Models.Snippet]:
+        """
+        asks masscode for the snippet of `key`, bypassing the cache
+        """
+        found = [s for s in MasscodeApi.snippets(params={"name" : key}) if not s.get("isDeleted")]
+        if not found:
+            self.cache.drop(key)
             return None
-        return snippet["content"][0]['value']
-    
-    def set(self, key : str, value : str):
-        snippet = self.get(key)
+        self.cache.put(found[0])
+        return found[0]
+
+    def _fetch_all(self) -> typing.Dict[str, Models.Snippet]:
+        """
+        lists every snippet in masscode with a single request, bypassing the cache
+        """
+        snippets = MasscodeApi.snippets()
+        self.cache.put_many(snippets, complete=True)
+        return {s["name"]: s for s in snippets if not s.get("isDeleted")}
+
+    def _fetch_many(self, keys : typing.Iterable[str]) -> typing.Dict[str, typing.Optional[Models.Snippet]]:
+        keys = list(dict.fromkeys(keys))
+        if len(keys) == 1:
+            return {keys[0]: self._fetch(keys[0])}
+        listing = self._fetch_all() if keys else {}
+        return {key: listing.get(key) for key in keys}
+
+    def _write(self, key : str, value : str, snippet : typing.Optional[Models.Snippet]) -> Models.Snippet:
+        """
+        creates the snippet of `key` or updates the fetched `snippet`
+        """
+        now = int(time.time())
         if snippet is None:
-            snippet = MasscodeApi.create_snippet(
+            return MasscodeApi.create_snippet(
                 name=key,
                 content=[{
                     "language" : "plain_text",
                     "value" : value,
                     "label" : "main"
                 }],
-                createdAt=int(time.time()),
-                updatedAt=int(time.time()),
+                createdAt=now,
+                updatedAt=now,
             )
-        else:
-            snippet.content[0]['value'] = value
-            snippet.updatedAt = int(time.time())
-            MasscodeApi.update_snippet(snippet)
+        content = [dict(snippet["content"][0], value=value)] + snippet["content"][1:]
+        return MasscodeApi.update_snippet(dict(snippet, content=content, updatedAt=now))
+
+    def get(self, key : str):
+        snippet = self.snippet(key)
+        if snippet is None:
+            return None
+        return snippet["content"][0]['value']
+    
+    def set(self, key : str, value : str):
+        snippet = self._write(key, value, self._fetch(key))
+        self.cache.put(snippet)
         return snippet
 
+    def prefetch(self) -> int:
+        """
+        caches every snippet with a single request
+        """
+        return len(self._fetch_all())
+
+    def _snippets(self) -> typing.Dict[str, Models.Snippet]:
+        listing = self.cache.listing()
+        if listing is None:
+            self.prefetch()
+            listing = self.cache.listing() or {}
+        return listing
+
+    def snippet_many(self, keys : typing.Iterable[str]) -> typing.Dict[str, typing.Optional[Models.Snippet]]:
+        """
+        snippets of `keys`, the ones not cached are fetched in one listing
+        """
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            hit, snippet = self.cache.lookup(key)
+            if hit:
+                found[key] = snippet
+            else:
+                missing.append(key)
+        if len(missing) == 1:
+            found[missing[0]] = self.snippet(missing[0])
+        elif missing:
+            self.prefetch()
+            listing = self.cache.listing() or {}
+            found.update((key, listing.get(key)) for key in missing)
+        return found
+
+    def get_many(self, keys : typing.Iterable[str]) -> typing.Dict[str, typing.Optional[str]]:
+        return {
+            key: None if snippet is None else snippet["content"][0]['value']
+            for key, snippet in self.snippet_many(keys).items()
+        }
+
+    def set_many(self, values : typing.Mapping[str, str]) -> typing.Dict[str, Models.Snippet]:
+        """
+        writes `values`, skipping keys already holding the same value.
+        masscode has no bulk endpoint, each changed key is one request.
+        keys failing to write do not stop the others, they are raised
+        together as PartialWriteError once the cache holds the rest
+        """
+        snippets = self._fetch_many(values)
+        written = []
+        failed = {}
+        for key, value in values.items():
+            snippet = snippets[key]
+            if snippet is not None and snippet["content"][0]['value'] == value:
+                continue
+            try:
+                snippets[key] = self._write(key, value, snippet)
+            except Exception as e:  # noqa
+                failed[key] = e
+                continue
+            written.append(snippets[key])
+        # failed keys keep the snippet just fetched from masscode
+        self.cache.put_many(written)
+        if failed:
+            raise PartialWriteError(failed)
+        return snippets
+
+    def delete_many(self, keys : typing.Iterable[str]) -> typing.List[str]:
+        """
+        deletes the snippets of `keys`, returns the keys that existed. like
+        `set_many`, failures are raised together after the others
+        """
+        deleted = []
+        failed = {}
+        for key, snippet in self._fetch_many(keys).items():
+            if snippet is None:
+                continue
+            try:
+                MasscodeApi.delete_snippet(snippet["id"])
+            except Exception as e:  # noqa
+                failed[key] = e
+                continue
+            deleted.append(key)
+        self.cache.drop_many(deleted)
+        if failed:
+            raise PartialWriteError(failed)
+        return deleted
+
+    def items(self) -> typing.Dict[str, str]:
+        return {
+            name: snippet["content"][0]['value']
+            for name, snippet in self._snippets().items()
+        }
+
+    def clear(self):
+        self.delete_many(self.keys())
+
     def __getitem__(self, key : str):
         return self.get(key)
     
     def __setitem__(self, key : str, value : str):
         return self.set(key, value)
+
+    def __delitem__(self, key : str):
+        if not self.delete_many([key]):
+            raise KeyError(key)
     
     def keys(self):
-        return [snippet["name"] for snippet in MasscodeApi.snippets()]
+        return list(self._snippets())
 
 kvstore = _Kvstore()
 
 
-def parse_document(document: str) -> dict:
-    pattern = r'<\$@(\w+)>'
-    matches = re.findall(pattern, document)
-    
-    for match in matches:
-        key = match
-        snippet = kvstore.get(key)
-        
-        if snippet is None:
+# placeholders, with the `//` or `#` comment prefix they may have at a line start
+_PLACEHOLDER = re.compile(r'(?m)(?:^(?://|#))?<\$@(\w+)>')
+
+
+def parse_document(document: str, store: typing.Optional[typing.Mapping[str, str]] = None) -> str:
+    """
+    replaces every `<$@key>` placeholder of `document` by its value in `store`,
+    the kvstore by default. each key is looked up once, and a comment prefix
+    at the start of the line is dropped with the placeholder
+    """
+    if store is None:
+        store = kvstore
+
+    tokens = list(_PLACEHOLDER.finditer(document))
+    keys = list(dict.fromkeys(m.group(1) for m in tokens))
+    if hasattr(store, "get_many"):
+        values = store.get_many(keys)
+    else:
+        values = {key: store.get(key) for key in keys}
+    for key in keys:
+        if values.get(key) is None:
             raise ValueError(f"Key {key} not found in store")
-        document = re.sub(r'^//<\$@' + re.escape(key) + '>', f'<$@{key}>', document, flags=re.MULTILINE)
-        document = re.sub(r'^#<\$@' + re.escape(key) + '>', f'<$@{key}>', document, flags=re.MULTILINE)
-        document = document.replace(f'<$@{key}>', snippet)
-        
-    return document
\ No newline at end of file
+
+    parts = []
+    last = 0
+    for m in tokens:
+        parts.append(document[last:m.start()])
+        parts.append(values[m.group(1)])
+        last = m.end()
+    parts.append(document[last:])
+    return "".join(parts)
@@ -0,0 +1,115 @@
+import json
+import os
+import time
+import typing
+
+from ..cacher.locks import FileLock
+from ..cacher.utils import dump_json_atomic
+
+
+class SnippetCache:
+    """
+    local copy of masscode snippets by name, shared by every process through
+    a json file. entries are served until they are older than `ttl` seconds
+    (forever when None), and are never replaced by an older `updatedAt`
+    """
+
+    def __init__(self, path: str, ttl: typing.Optional[float] = None):
+        self.path = path
+        self.ttl = ttl
+        self.fileLock = FileLock(path + ".lock")
+        self._mtime = None
+        self._data = {"complete": None, "snippets": {}}
+
+    def _load(self) -> dict:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return self._data
+        if mtime != self._mtime:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {"complete": None, "snippets": {}}
+            self._mtime = mtime
+        return self._data
+
+    def _fresh(self, fetched: typing.Optional[float]) -> bool:
+        return fetched is not None and (
+            self.ttl is None or time.time() - fetched < self.ttl
+        )
+
+    def lookup(self, name: str) -> typing.Tuple[bool, typing.Optional[dict]]:
+        """
+        (hit, snippet). a fresh complete listing without `name` is a hit on None
+        """
+        data = self._load()
+        entry = data["snippets"].get(name)
+        if entry is not None and self._fresh(entry["fetched"]):
+            return True, entry["snippet"]
+        if entry is None and self._fresh(data["complete"]):
+            return True, None
+        return False, None
+
+    def listing(self) -> typing.Optional[typing.Dict[str, dict]]:
+        """
+        name -> snippet of every snippet while the complete listing is fresh
+        """
+        data = self._load()
+        if not self._fresh(data["complete"]):
+            return None
+        return {name: entry["snippet"] for name, entry in data["snippets"].items()}
+
+    def _commit(self, update: typing.Callable[[dict], None]):
+        with self.fileLock:
+            self._mtime = None
+            data = self._load()
+            update(data)
+            dump_json_atomic(self.path, data)
+            self._data = data
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def put_many(self, snippets: typing.Iterable[dict], complete: bool = False):
+        """
+        stores fetched `snippets`, replacing every entry when they are the
+        complete listing
+        """
+        now = time.time()
+
+        def update(data: dict):
+            if complete:
+                data["snippets"] = {}
+                data["complete"] = now
+            entries = data["snippets"]
+            for snippet in snippets:
+                if snippet.get("isDeleted"):
+                    continue
+                old = entries.get(snippet["name"])
+                if old and old["snippet"].get("updatedAt", 0) > snippet.get("updatedAt", 0):
+                    continue
+                entries[snippet["name"]] = {"snippet": snippet, "fetched": now}
+
+        self._commit(update)
+
+    def put(self, snippet: dict):
+        self.put_many([snippet])
+
+    def drop_many(self, names: typing.Iterable[str]):
+        names = list(names)
+
+        def update(data: dict):
+            for name in names:
+                data["snippets"].pop(name, None)
+
+        self._commit(update)
+
+    def drop(self, name: str):
+        self.drop_many([name])
+
+    def clear(self):
+        def update(data: dict):
+            data["snippets"] = {}
+            data["complete"] = None
+
+        self._commit(update)
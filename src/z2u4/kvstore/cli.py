@@ -1,7 +1,7 @@
 
 import json
 import click
-from . import kvstore
+from . import PartialWriteError, kvstore
 
 @click.group()
 def cli():
@@ -30,10 +30,30 @@ def reset():
 @click.argument("file", type=click.Path())
 def export(file):
     with open(file, "w") as f:
-        json.dump(kvstore, f)
+        json.dump(kvstore.items(), f, ensure_ascii=False, indent=2)
     click.echo("KVStore exported")
 
 
+@cli.command("import")
+@click.argument("file", type=click.Path(exists=True))
+def import_(file):
+    with open(file, "r") as f:
+        values = json.load(f)
+    try:
+        kvstore.set_many(values)
+    except PartialWriteError as e:
+        for key, error in e.failed.items():
+            click.echo(f"Failed to import {key}: {error}", err=True)
+        raise SystemExit(1)
+    click.echo("KVStore imported")
+
+
 @cli.command()
 def keys():
     click.echo(kvstore.keys())
+
+
+@cli.command()
+def prefetch():
+    """cache every snippet locally in one request"""
+    click.echo(f"{kvstore.prefetch()} snippets cached")
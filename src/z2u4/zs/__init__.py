@@ -1,8 +1,5 @@
 import datetime
 import click
-from tabulate import tabulate
-
-from z2u4.zs.selfResolve import USRPATH_CONFIG, install_dependencies
 
 
 fts = lambda x: datetime.datetime.fromtimestamp(x).strftime("%Y-%m-%d %H:%M:%S")  # noqa
@@ -15,6 +12,7 @@ def cli():
 
 @cli.command("list")
 def _list():
+    from tabulate import tabulate
     from z2u4.zs.selfResolve import gather_installed_mods
 
     mods = gather_installed_mods()
@@ -30,7 +28,7 @@ def _list():
 def add(url):
     assert url.endswith(".git"), "URL must end with .git"
     from z2u4.cacher.core import Cacher
-    from z2u4.zs.selfResolve import get_shell_path
+    from z2u4.zs.selfResolve import USRPATH_CONFIG, get_shell_path, install_dependencies
 
     id = Cacher.cache(type_="gitRepo", url=url)
     item = Cacher.CACHE[id]
@@ -71,17 +69,18 @@ def remove(name, clear_cache):
 
 @cli.command()
 def list():
-    from z2u4.zs.selfResolve import gather_installed_shells_from_usrpath, gather_installed_shells
+    from z2u4.zs.selfResolve import shell_roots
 
-    shells = gather_installed_shells_from_usrpath()
+    shells = shell_roots()
     click.echo("Installed from USRPATH:")
-    for name, shell in shells.items():
-        click.echo(name)    
+    for name, (_, source) in shells.items():
+        if source == "usrpath":
+            click.echo(name)
 
     click.echo("\nInstalled from Z2U4:")
-    shells = gather_installed_shells()
-    for name, shell in shells.items():
-        click.echo(name)
+    for name, (_, source) in shells.items():
+        if source == "z2u4":
+            click.echo(name)
 
 @cli.group()
 def alias():
@@ -112,25 +111,53 @@ def alias_list():
     from z2u4.zs.selfResolve import USRPATH_CONFIG
     click.echo(USRPATH_CONFIG["aliases"])
 
-@cli.group()
-def run():
-    pass
+class LazyShellGroup(click.Group):
+    """
+    lists shells from the command manifest and imports only the invoked one
+    """
 
+    def list_commands(self, ctx):
+        from z2u4.zs.selfResolve import shell_roots
 
-def _run():
-    from z2u4.zs.selfResolve import gather_installed_shells, gather_installed_shells_from_usrpath
+        return sorted(set(super().list_commands(ctx)) | set(shell_roots()))
+
+    def get_command(self, ctx, cmd_name):
+        cmd = super().get_command(ctx, cmd_name)
+        if cmd is not None:
+            return cmd
+
+        from z2u4.zs.selfResolve import import_shell
+
+        shell = import_shell(cmd_name)
+        if shell is None:
+            return None
+        self.add_command(shell.cli, cmd_name)
+        return shell.cli
 
-    shells = gather_installed_shells()
-    for name, shell in shells.items():
-        run.add_command(shell.cli, name)
+    def format_commands(self, ctx, formatter):
+        from z2u4.zs.selfResolve import resolve_shell, shell_roots
 
-    shells = gather_installed_shells_from_usrpath()
-    for name, shell in shells.items():
-        run.add_command(shell.cli, name)
-        alias = USRPATH_CONFIG["aliases"].get(name, None)
-        if alias and alias not in run.commands:
-            run.add_command(shell.cli, alias)
+        roots = shell_roots()
+        rows = []
+        for name in sorted(set(super().list_commands(ctx)) | set(roots)):
+            if name in roots:
+                # read from the source, the shell is not imported
+                entry = resolve_shell(name, roots)
+                rows.append((name, entry["help"] if entry else ""))
+            else:
+                rows.append((name, self.commands[name].get_short_help_str()))
 
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+@cli.group(cls=LazyShellGroup)
+def run():
+    pass
+
+
+def _run():
     cli()
 
 
@@ -2,21 +2,35 @@ from functools import cache
 
 import os
 import subprocess
-import toml
-from zuu.PKG.importlib import import_file
-from zuu.STRUCT.dict_with_autosave import DictWithAutosave
+import typing
 
 PATH = os.path.dirname(os.path.abspath(os.path.realpath(__file__)))
 BASEPATH = os.path.dirname(PATH)
 
 USRPATH = os.path.join(os.path.expanduser("~"), ".z2u4", "zs")
-os.makedirs(USRPATH, exist_ok=True)
 _USRPATH_CONFIG_PATH = os.path.join(USRPATH, "config.json")
 
-# this config -> key (name) : value {uuid, url}
-USRPATH_CONFIG = DictWithAutosave(_USRPATH_CONFIG_PATH)
-USRPATH_CONFIG.setdefault("aliases", {})
-USRPATH_CONFIG.setdefault("shells", {})
+
+@cache
+def get_config():
+    """
+    loads the zs config on first use
+    this config -> key (name) : value {uuid, url}
+    """
+    from zuu.STRUCT.dict_with_autosave import DictWithAutosave
+
+    os.makedirs(USRPATH, exist_ok=True)
+    config = DictWithAutosave(_USRPATH_CONFIG_PATH)
+    config.setdefault("aliases", {})
+    config.setdefault("shells", {})
+    return config
+
+
+def __getattr__(name: str):
+    if name == "USRPATH_CONFIG":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 @cache
 def gather_installed_mods() -> list[dict]:
@@ -40,22 +54,6 @@ def gather_installed_mods() -> list[dict]:
 
     return mods
 
-@cache
-def gather_installed_shells():
-    shells = {}
-    for mod in gather_installed_mods():
-        path = mod["path"]
-        cli_path = os.path.join(path, "cli.py")
-
-        if not os.path.exists(cli_path):
-            continue
-
-        filemod = import_file(cli_path, f"z2u4.{mod['name']}")
-
-        shells[mod["name"]] = filemod
-
-    return shells
-
 def get_shell_path(path : str):
     if os.path.exists(os.path.join(path, "cli.py")):
         return os.path.join(path, "cli.py"), None
@@ -75,41 +73,395 @@ def get_shell_path(path : str):
     ):
         return os.path.join(path, "src", kk[0], "cli.py"), kk[0]
 
-def install_dependencies(path : str):
+def _bump_version(version: str, index: int) -> str:
+    parts = [int(x) if x.isdigit() else 0 for x in version.split(".")]
+    parts = parts[: index + 1]
+    parts[index] += 1
+    return ".".join(str(x) for x in parts)
+
+
+def _poetry_specifier(spec: str) -> str:
+    """
+    converts a poetry version constraint ("^1.2", "~1.2", "1.2", ">=1,<2")
+    into a PEP 440 specifier
+    """
+    specifiers = []
+    for part in spec.replace(" ", "").split(","):
+        if part in ("", "*"):
+            continue
+        if part.startswith("^"):
+            version = part[1:]
+            parts = version.split(".")
+            index = next((i for i, x in enumerate(parts) if x != "0"), len(parts) - 1)
+            specifiers.append(f">={version},<{_bump_version(version, index)}")
+        elif part.startswith("~") and not part.startswith("~="):
+            version = part[1:]
+            index = 1 if len(version.split(".")) > 1 else 0
+            specifiers.append(f">={version},<{_bump_version(version, index)}")
+        elif part[0].isdigit():
+            specifiers.append(f"=={part}")
+        else:
+            specifiers.append(part)
+    return ",".join(specifiers)
+
+
+def _poetry_applies(spec: dict) -> bool:
+    """
+    whether the `python` and `markers` restrictions of a dependency match the
+    running interpreter
+    """
+    import platform
+
+    try:
+        from packaging.markers import Marker
+        from packaging.specifiers import SpecifierSet
+    except ImportError:
+        return True
+
+    python = spec.get("python")
+    if python and not any(
+        SpecifierSet(_poetry_specifier(alt)).contains(platform.python_version())
+        for alt in python.split("||")
+    ):
+        return False
+    markers = spec.get("markers")
+    return not markers or Marker(markers).evaluate()
+
+
+def _poetry_requirement(name: str, spec, root: str = "."):
+    """
+    converts a [tool.poetry.dependencies] entry into a PEP 508 requirement,
+    None when it does not apply to this interpreter or is optional
+    """
+    import logging
+    import pathlib
+
+    if name.lower() == "python":
+        return None
+    if isinstance(spec, list):
+        # multiple constraints, the first one matching this interpreter wins
+        spec = next((s for s in spec if _poetry_applies(s)), None)
+        if spec is None:
+            return None
+    if isinstance(spec, str):
+        spec = {"version": spec}
+    if not isinstance(spec, dict):
+        logging.warning(f"Skipping dependency {name}, unsupported spec {spec!r}")
+        return None
+    if spec.get("optional") or not _poetry_applies(spec):
+        return None
+
+    extras = spec.get("extras")
+    requirement = f"{name}[{','.join(extras)}]" if extras else name
+    if "git" in spec:
+        ref = spec.get("rev") or spec.get("tag") or spec.get("branch")
+        return f"{requirement} @ git+{spec['git']}" + (f"@{ref}" if ref else "")
+    if "url" in spec:
+        return f"{requirement} @ {spec['url']}"
+    if "path" in spec:
+        path = os.path.abspath(os.path.join(root, spec["path"]))
+        return f"{requirement} @ {pathlib.Path(path).as_uri()}"
+    if "version" not in spec:
+        logging.warning(f"Skipping dependency {name}, unsupported spec {spec!r}")
+        return None
+    return requirement + _poetry_specifier(spec["version"].strip())
+
+
+def read_requirements(path: str) -> list[str]:
+    import toml
+
     if os.path.exists(os.path.join(path, "pyproject.toml")):
         pyproject = toml.load(os.path.join(path, "pyproject.toml"))
-        deps = pyproject.get("tool", {}).get("poetry", {}).get("dependencies", [])
-        if not deps:
+        poetry = pyproject.get("tool", {}).get("poetry", {}).get("dependencies", {})
+        deps = [_poetry_requirement(name, spec, path) for name, spec in poetry.items()]
+        if not poetry:
             deps = pyproject.get("project", {}).get("dependencies", [])
     elif (os.path.exists(os.path.join(path, "requirements.txt"))):
         with open(os.path.join(path, "requirements.txt"), "r") as f:
-            deps = f.read().splitlines()
+            deps = [line.split(" #", 1)[0].strip() for line in f.read().splitlines()]
+        deps = [dep for dep in deps if dep and not dep.startswith("#")]
     elif os.path.exists(os.path.join(path, "setup.py")):
+        from zuu.PKG.importlib import import_file
+
         mod = import_file(os.path.join(path, "setup.py"), "setup")
         deps = mod.install_requires or []
     else:
-        return
+        return []
+
+    return [dep for dep in deps if dep]
+
+
+def is_satisfied(requirement: str) -> bool:
+    """
+    checks a requirement against the installed distributions
+    """
+    import importlib.metadata
+
+    if requirement.startswith("-"):
+        # pip options (-e, -r, --index-url, ...) cannot be checked
+        return False
+
+    try:
+        from packaging.requirements import InvalidRequirement, Requirement
+    except ImportError:
+        import re
+
+        name = re.split(r"[\s<>=!~;\[@]", requirement, 1)[0]
+        try:
+            importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            return False
+        return True
+
+    try:
+        req = Requirement(requirement)
+    except InvalidRequirement:
+        return False
+    if req.marker is not None and not req.marker.evaluate():
+        return True
+    try:
+        version = importlib.metadata.version(req.name)
+    except importlib.metadata.PackageNotFoundError:
+        return False
+    return req.specifier.contains(version, prereleases=True)
+
+
+_DEPS_STATE_PATH = os.path.join(USRPATH, "deps.json")
+
 
+def install_dependencies(path : str, force : bool = False):
+    """
+    installs the requirements of the shell at `path` that are not satisfied
+    yet, in a single pip invocation. the hash of the requirement set is
+    remembered per interpreter and shell so unchanged shells skip the check
+    entirely
+    """
+    import hashlib
+    import json
+    import sys
+    from z2u4.cacher.utils import dump_json_atomic
+
+    deps = read_requirements(path)
     if not deps:
         return
 
-    for dep in deps:
-        subprocess.run(["pip", "install", dep])
+    digest = hashlib.sha256("\n".join(sorted(deps)).encode("utf-8")).hexdigest()
+    try:
+        with open(_DEPS_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    installed = state.setdefault(sys.executable, {})
+    if not force and installed.get(path) == digest:
+        return
 
-@cache
-def gather_installed_shells_from_usrpath():
+    missing = [dep for dep in deps if not is_satisfied(dep)]
+    if missing:
+        subprocess.run([sys.executable, "-m", "pip", "install", *missing], check=True)
+
+    installed[path] = digest
+    dump_json_atomic(_DEPS_STATE_PATH, state)
+
+_MANIFEST_PATH = os.path.join(USRPATH, "manifest.json")
+
+
+def _git_head(path: str):
+    git = os.path.join(path, ".git")
+    try:
+        with open(os.path.join(git, "HEAD"), "r") as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    if not head.startswith("ref: "):
+        return head
+
+    ref = head[len("ref: ") :]
+    try:
+        with open(os.path.join(git, ref), "r") as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(git, "packed-refs"), "r") as f:
+            for line in f:
+                if line.rstrip().endswith(" " + ref):
+                    return line.split(" ", 1)[0]
+    except OSError:
+        pass
+    return head
+
+
+def shell_stamp(root: str, cli_path: str) -> str:
+    """
+    changes whenever a shell may have changed: the git HEAD of cached repos,
+    the mtime of cli.py otherwise
+    """
+    head = _git_head(root)
+    if head:
+        return f"git:{head}"
+    return f"mtime:{os.path.getmtime(cli_path)}"
+
+
+def shell_roots() -> dict:
+    """
+    name -> (root path, source) of every shell, without importing any of them
+    """
     from z2u4.cacher.core import Cacher
 
-    shells = {}
+    roots = {}
+    for mod in gather_installed_mods():
+        if os.path.exists(os.path.join(mod["path"], "cli.py")):
+            roots[mod["name"]] = (mod["path"], "z2u4")
 
-    for name, id in USRPATH_CONFIG.get("shells", {}).items():
-        path = Cacher.get_path(id)
-        res = get_shell_path(path)  
-        if res:
-            cli_path, mod_name = res
-            filemod = import_file(cli_path, mod_name)
-            shells[name] = filemod
-        else:
+    config = get_config()
+    for name, id in config.get("shells", {}).items():
+        roots[name] = (Cacher.get_path(id), "usrpath")
+    for name, alias in config.get("aliases", {}).items():
+        if name in roots and roots[name][1] == "usrpath" and alias not in roots:
+            roots[alias] = roots[name]
+
+    return roots
+
+
+@cache
+def load_manifest() -> dict:
+    import json
+
+    try:
+        with open(_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest():
+    from z2u4.cacher.utils import dump_json_atomic
+
+    dump_json_atomic(_MANIFEST_PATH, load_manifest())
+
+
+def read_help(cli_path: str) -> str:
+    """
+    short help of the `cli` group of a shell, read from its source without
+    importing it: the help passed to the decorator, else the docstring of
+    the function or of the module
+    """
+    import ast
+    from click.utils import make_default_short_help
+
+    try:
+        with open(cli_path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return ""
+
+    text = ast.get_docstring(tree) or ""
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef) or node.name != "cli":
             continue
+        text = ast.get_docstring(node) or text
+        for decorator in node.decorator_list:
+            if not isinstance(decorator, ast.Call):
+                continue
+            for keyword in decorator.keywords:
+                if (
+                    keyword.arg in ("help", "short_help")
+                    and isinstance(keyword.value, ast.Constant)
+                    and isinstance(keyword.value.value, str)
+                ):
+                    if keyword.arg == "short_help":
+                        return keyword.value.value
+                    text = keyword.value.value
+    return make_default_short_help(text) if text else ""
+
+
+def _import_cli(cli_path: str, module, name: str):
+    """
+    imports the cli.py of a shell, as the `cli` submodule of its package when
+    it has one so relative imports keep working
+    """
+    import importlib
+    import importlib.util
+    import sys
+
+    if module:
+        if "." not in module:
+            parent = os.path.dirname(os.path.dirname(cli_path))
+            if parent not in sys.path:
+                sys.path.insert(0, parent)
+        return importlib.import_module(f"{module}.cli")
+
+    modname = f"zs_shells.{name}"
+    spec = importlib.util.spec_from_file_location(modname, cli_path)
+    filemod = importlib.util.module_from_spec(spec)
+    sys.modules[modname] = filemod
+    spec.loader.exec_module(filemod)
+    return filemod
+
+
+def resolve_shell(name: str, roots: typing.Optional[dict] = None):
+    """
+    returns the manifest entry {cli, module, stamp, help} of a shell,
+    rebuilding it when the shell changed since it was recorded. nothing is
+    imported or installed, listing help stays cheap. callers resolving
+    several shells pass `roots` from a single `shell_roots()`
+    """
+    if roots is None:
+        roots = shell_roots()
+    if name not in roots:
+        return None
+    root, source = roots[name]
+
+    manifest = load_manifest()
+    entry = manifest.get(root)
+    if (
+        entry
+        and os.path.exists(entry["cli"])
+        and shell_stamp(root, entry["cli"]) == entry["stamp"]
+    ):
+        return entry
+
+    if source == "z2u4":
+        cli_path, module = os.path.join(root, "cli.py"), f"z2u4.{name}"
+    else:
+        res = get_shell_path(root)
+        if not res or not os.path.exists(res[0]):
+            return None
+        cli_path, module = res
+
+    entry = {
+        "cli": cli_path,
+        "module": module,
+        "stamp": shell_stamp(root, cli_path),
+        "help": read_help(cli_path),
+    }
+    manifest[root] = entry
+    _save_manifest()
+    return entry
+
+
+def import_shell(name: str):
+    """
+    imports only the cli module of the shell `name`, installing the
+    requirements of a cached shell first when it is new or changed
+    """
+    import sys
+
+    roots = shell_roots()
+    entry = resolve_shell(name, roots)
+    if entry is None:
+        return None
+
+    root, source = roots[name]
+    if source == "usrpath" and entry.get("installed") != sys.executable:
+        install_dependencies(root)
+        entry["installed"] = sys.executable
+        _save_manifest()
+
+    filemod = _import_cli(entry["cli"], entry["module"], name)
+    short_help = filemod.cli.get_short_help_str()
+    if entry["help"] != short_help:
+        entry["help"] = short_help
+        _save_manifest()
+    return filemod
 
-    return shells
@@ -0,0 +1,63 @@
+import os
+
+from src.z2u4.cacher.blobs import BlobStore
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_blob_store(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"), "hardlink")
+    a = str(tmp_path / "cache" / "a")
+    b = str(tmp_path / "cache" / "b")
+    _write(os.path.join(a, "asset.txt"), "same")
+    _write(os.path.join(b, "nested", "copy.txt"), "same")
+    _write(os.path.join(b, "other.txt"), "other")
+
+    store.ingest("a", a)
+    store.ingest("b", b)
+
+    # identical content is stored once
+    assert os.path.samefile(
+        os.path.join(a, "asset.txt"), os.path.join(b, "nested", "copy.txt")
+    )
+    digest = store.items["a"]["0"]["asset.txt"]
+    assert store.counts[digest] == 2
+
+    # refs survive a reload, refs from before generations belong to generation 0
+    assert BlobStore(store.root, "hardlink").counts == store.counts
+    legacy = str(tmp_path / "legacy")
+    _write(os.path.join(legacy, "refs.json"), '{"a": {"asset.txt": "%s"}}' % digest)
+    assert BlobStore(legacy, "hardlink").items == {"a": {"0": {"asset.txt": digest}}}
+
+    # releasing one item keeps the blob of the other
+    store.release("b")
+    assert store.counts[digest] == 1
+
+    # orphaned blobs are deleted
+    store.release("a")
+    assert not os.path.exists(store.blob_path(digest))
+    with open(os.path.join(a, "asset.txt")) as f:
+        assert f.read() == "same"
+
+
+def test_blob_refs_merge_across_stores(tmp_path):
+    root = str(tmp_path / "blobs")
+    first = BlobStore(root, "symlink")
+    second = BlobStore(root, "symlink")
+    a = str(tmp_path / "cache" / "a")
+    b = str(tmp_path / "cache" / "b")
+    _write(os.path.join(a, "shared.txt"), "same")
+    _write(os.path.join(b, "shared.txt"), "same")
+
+    first.ingest("a", a)
+    second.ingest("b", b)
+    assert sorted(BlobStore(root, "symlink").items) == ["a", "b"]
+
+    # the blob is still used by b, which the first store never saw
+    first.release("a")
+    with open(os.path.join(b, "shared.txt")) as f:
+        assert f.read() == "same"
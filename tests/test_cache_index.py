@@ -0,0 +1,40 @@
+from src.z2u4.cacher.index import CacheIndex
+
+
+def _item(type_, **meta):
+    return {"type": type_, "lastChecked": 0, "checkInterval": 60, "meta": meta}
+
+
+def test_cache_index(tmp_path):
+    path = str(tmp_path / "index.json")
+    cache = {
+        "a": _item("gitRepo", url="https://github.com/o/r.git", owner="o", repo="r"),
+        "b": _item("webTarget", url="https://example.com/f.bin"),
+    }
+
+    index = CacheIndex(path)
+    index.sync(cache)
+
+    # lookups
+    assert index.find_value("o") == "a"
+    assert index.find_value("o", "webTarget") is None
+    assert index.find_params("webTarget", {"url": "https://example.com/f.bin"}) == "b"
+    assert index.find_params("gitRepo", {"url": "https://example.com/f.bin"}) is None
+    assert index.of_type("gitRepo") == ["a"]
+
+    # persisted and reloaded without a rebuild
+    reloaded = CacheIndex(path)
+    reloaded.sync(cache)
+    assert reloaded.find_value("r") == "a"
+
+    # removal keeps every map consistent
+    index.discard("a")
+    assert index.find_value("o") is None
+    assert index.of_type("gitRepo") == []
+
+    # a stale index is rebuilt against the cache
+    cache["c"] = _item("webTarget", url="https://example.com/g.bin")
+    stale = CacheIndex(path)
+    stale.sync(cache)
+    assert stale.find_value("https://example.com/g.bin") == "c"
+    assert stale.find_value("o") == "a"
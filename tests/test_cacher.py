@@ -0,0 +1,659 @@
+import os
+import shutil
+
+import pytest
+from src.z2u4.cacher.core import Cacher
+
+
+@pytest.fixture
+def cacher(tmp_path):
+    Cacher.configure(str(tmp_path / "cacher"))
+    yield Cacher
+    Cacher.configure()
+
+
+def test_configure_is_lazy(tmp_path):
+    import subprocess
+    import sys
+
+    root = str(tmp_path / "lazy")
+    Cacher.configure(root)
+    try:
+        assert not os.path.exists(root)
+        assert len(Cacher.CACHE) == 0
+        assert os.path.exists(Cacher.CACHE_PATH)
+    finally:
+        Cacher.configure()
+
+    # the sync api does not import asyncio
+    script = "import sys, src.z2u4.cacher.core; assert 'asyncio' not in sys.modules"
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", script], cwd=repo, check=True)
+
+
+def test_cache_local_target(cacher, tmp_path):
+    source = tmp_path / "data.txt"
+    source.write_text("data")
+
+    id = cacher.cache("localTarget", path=str(source))
+    assert cacher.cache("localTarget", path=str(source)) == id
+    assert cacher.query(str(source)) is cacher.CACHE[id]
+    assert cacher.query(f"localTarget/{id}") is cacher.CACHE[id]
+    with open(os.path.join(cacher.get_path(id), "data.txt")) as f:
+        assert f.read() == "data"
+
+    cacher.remove(id)
+    assert cacher.query(str(source)) is None
+    assert not os.path.exists(cacher.get_path(id))
+
+
+def test_check_all(cacher, tmp_path, monkeypatch):
+    import threading
+    import time
+
+    ids = []
+    for name in ["a", "b", "c", "broken"]:
+        source = tmp_path / f"{name}.txt"
+        source.write_text(name)
+        ids.append(cacher.cache("localTarget", path=str(source)))
+    other = tmp_path / "fresh.txt"
+    other.write_text("fresh")
+    fresh = cacher.cache("localTarget", path=str(other))
+    (tmp_path / "broken.txt").unlink()
+    for id in ids:
+        cacher.CACHE[id]["lastChecked"] = 0
+        cacher.CACHE.save(id)
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+    renew = cacher.renew_localTarget
+
+    def counting(id, item, path):
+        with lock:
+            running.append(id)
+            peak.append(len(running))
+        try:
+            time.sleep(0.05)
+            return renew(id, item, path)
+        finally:
+            with lock:
+                running.remove(id)
+
+    writes = []
+    write = cacher.CACHE._write
+    monkeypatch.setattr(cacher, "renew_localTarget", counting)
+    monkeypatch.setattr(cacher.CACHE, "_write", lambda ids: (writes.append(ids), write(ids)))
+
+    results = {r["id"]: r for r in cacher.check_all(workers=8, perHost=2)}
+    assert {id: r["status"] for id, r in results.items()} == {
+        ids[0]: "renewed",
+        ids[1]: "renewed",
+        ids[2]: "renewed",
+        ids[3]: "failed",
+        fresh: "skipped",
+    }
+    assert results[ids[3]]["error"]
+    # every item renews from the local host, two at a time
+    assert max(peak) == 2
+    # each renewed item is written once, before its lock is released
+    assert sorted(id for ids_ in writes for id in ids_) == sorted(ids[:3])
+    assert cacher.CACHE[ids[0]]["lastChecked"] > 0
+
+
+def test_refresh_scheduler(cacher, tmp_path):
+    from src.z2u4.cacher.scheduler import RefreshScheduler
+
+    source = tmp_path / "data.txt"
+    source.write_text("v1")
+    soon = cacher.cache("localTarget", path=str(source), _checkInteval=60)
+    other = tmp_path / "other.txt"
+    other.write_text("other")
+    later = cacher.cache("localTarget", path=str(other), _checkInteval=None)
+    # expires in 5 seconds, inside the lead window
+    cacher.CACHE[soon]["lastChecked"] -= 55
+    cacher.CACHE.save(soon)
+    checked = cacher.CACHE[soon]["lastChecked"]
+
+    source.write_text("v2")
+    scheduler = RefreshScheduler(cacher, lead=10, jitter=0, workers=2)
+    scheduler.scan()
+    assert [row["id"] for row in scheduler.snapshot()] == [soon]
+
+    scheduler.run(once=True)
+    assert cacher.CACHE[soon]["lastChecked"] > checked
+    assert later not in [row["id"] for row in scheduler.snapshot()]
+    with open(os.path.join(cacher.get_path(soon), "data.txt")) as f:
+        assert f.read() == "v2"
+
+
+def test_evict_lru(cacher, tmp_path, monkeypatch):
+    ids = []
+    for name in ["a", "b", "c"]:
+        source = tmp_path / f"{name}.txt"
+        source.write_text(name * 100)
+        ids.append(cacher.cache("localTarget", path=str(source), _checkInteval=None))
+    a, b, c = ids
+    assert all(cacher.CACHE[id]["size"] == 100 for id in ids)
+
+    cacher.query(a)
+    cacher.CACHE[c]["pinned"] = True
+    cacher.CACHE.save(c)
+
+    # under quota, no item is looked at
+    def fail(*args):
+        raise AssertionError("scanned the items under quota")
+
+    cacher.CONFIG["quota"] = 300
+    monkeypatch.setattr(cacher, "iter_cache", fail)
+    assert cacher.evict() == []
+    monkeypatch.undo()
+
+    cacher.CONFIG["quota"] = 250
+
+    # b is the least recently used unpinned item
+    assert cacher.evict() == [b]
+    assert cacher.CACHE[b]["evicted"]
+    assert not os.path.exists(cacher.get_path(b))
+    assert cacher.CACHE[a]["hits"] == 1
+
+    # evicted items are skipped by check_all and fetched again on demand
+    assert {r["id"]: r["status"] for r in cacher.check_all()}[b] == "skipped"
+    cacher.CONFIG["quota"] = "1K"
+    assert cacher.check(b) == 1
+    assert "evicted" not in cacher.CACHE[b]
+    assert os.path.exists(os.path.join(cacher.get_path(b), "b.txt"))
+
+
+def _git(*args, cwd=None):
+    import subprocess
+
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_git_repo(cacher, tmp_path, monkeypatch):
+    from src.z2u4.cacher import git
+
+    work = tmp_path / "work"
+    work.mkdir()
+    _git("init", "-q", "-b", "main", cwd=work)
+    (work / "cli.py").write_text("v1")
+    (work / "big.bin").write_text("x" * 1000)
+    _git("add", ".", cwd=work)
+    _git("commit", "-qm", "v1", cwd=work)
+    bare = tmp_path / "remote.git"
+    _git("clone", "-q", "--bare", str(work), str(bare))
+    url = bare.as_uri()
+
+    id = cacher.cache("gitRepo", url=url, branch="main", sparse=["cli.py"])
+    path = cacher.get_path(id)
+    assert cacher.CACHE[id]["meta"]["repo"] == "remote"
+    assert os.path.exists(os.path.join(path, "cli.py"))
+    assert not os.path.exists(os.path.join(path, "big.bin"))
+    assert (tmp_path / "cacher" / "cache" / id / ".git" / "shallow").exists()
+
+    # unchanged remote ref: nothing is fetched
+    def fail(*args, **kwargs):
+        raise AssertionError("fetched an unchanged repo")
+
+    monkeypatch.setattr(git, "update", fail)
+    cacher.check(id, force=True)
+    monkeypatch.undo()
+
+    (work / "cli.py").write_text("v2")
+    _git("commit", "-qam", "v2", cwd=work)
+    _git("push", "-q", str(bare), "main", cwd=work)
+    cacher.check(id, force=True)
+    with open(os.path.join(path, "cli.py")) as f:
+        assert f.read() == "v2"
+    assert cacher.CACHE[id]["commit"] == git.ls_remote(url, "main")
+
+
+@pytest.fixture
+def release_server():
+    import http.server
+    import json
+    import threading
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        assets = {"tool-linux.tar.gz": b"linux" * 10, "tool-win.zip": b"win" * 10}
+        release = {}
+        requests = []
+        limited = False
+
+        def do_GET(self):
+            self.requests.append(self.path)
+            if self.path.startswith("/repos/"):
+                etag = f'"{hash(json.dumps(self.release))}"'
+                if self.limited:
+                    self.send_response(403)
+                    self.send_header("X-RateLimit-Remaining", "0")
+                    self.send_header("X-RateLimit-Reset", "9999999999")
+                    self.end_headers()
+                    return
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = json.dumps(self.release).encode()
+            else:
+                etag = None
+                body = self.assets[self.path.rsplit("/", 1)[-1]]
+            self.send_response(200)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    def publish(updatedAt):
+        Handler.release = {
+            "tag_name": "v1",
+            "assets": [
+                {
+                    "id": i,
+                    "name": name,
+                    "size": len(body),
+                    "updated_at": updatedAt,
+                    "browser_download_url": f"{base}/download/{name}",
+                    "digest": "sha256:" + __import__("hashlib").sha256(body).hexdigest(),
+                }
+                for i, (name, body) in enumerate(Handler.assets.items())
+            ],
+        }
+
+    Handler.publish = staticmethod(publish)
+    yield base, Handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_github_release_assets(cacher, release_server, monkeypatch):
+    from src.z2u4.cacher import github
+
+    base, handler = release_server
+    monkeypatch.setattr(github, "API_URL", base)
+    handler.publish("2025-01-01T00:00:00Z")
+    cacher.GITHUB.ttl = 0
+
+    id = cacher.cache("githubRelease", owner="o", repo="r", asset="*linux*")
+    path = cacher.get_path(id)
+    assert os.listdir(path) == ["tool-linux.tar.gz"]
+    assert cacher.CACHE[id]["meta"] == {
+        "owner": "o",
+        "repo": "r",
+        "asset": "*linux*",
+        "url": "https://github.com/o/r/releases/latest",
+    }
+
+    # unchanged assets are not downloaded again
+    handler.requests.clear()
+    cacher.check(id, force=True)
+    assert handler.requests == ["/repos/o/r/releases/latest"]
+
+    handler.assets["tool-linux.tar.gz"] = b"linux v2"
+    handler.publish("2025-02-01T00:00:00Z")
+    cacher.check(id, force=True)
+    with open(os.path.join(path, "tool-linux.tar.gz"), "rb") as f:
+        assert f.read() == b"linux v2"
+
+
+def test_github_api_cache(cacher, release_server, monkeypatch):
+    from src.z2u4.cacher import github
+
+    base, handler = release_server
+    monkeypatch.setattr(github, "API_URL", base)
+    handler.publish("2025-01-01T00:00:00Z")
+
+    ids = [
+        cacher.cache("githubRelease", owner="o", repo="r", asset=pattern)
+        for pattern in ["*linux*", "*win*"]
+    ]
+    handler.requests.clear()
+    cacher.check_all(force=True)
+    # both items were answered by the cached release
+    assert not [p for p in handler.requests if p.startswith("/repos/")]
+
+    # stale entries are revalidated with their etag
+    cacher.GITHUB.ttl = 0
+    cacher.check(ids[0], force=True)
+    assert handler.requests[-1] == "/repos/o/r/releases/latest"
+    assert "data" in cacher.GITHUB.entries["releases/o/r/latest"]
+
+    # while rate limited the stale entry is served
+    handler.limited = True
+    cacher.check(ids[1], force=True)
+    cacher.check(ids[1], force=True)
+    assert [p for p in handler.requests if p.startswith("/repos/")] == [
+        "/repos/o/r/releases/latest"
+    ] * 2
+
+
+@pytest.fixture
+def slow_server():
+    import http.server
+    import threading
+    import time
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        # seconds between the 100 byte chunks of the body
+        delay = 0.0
+        requests = 0
+
+        def do_GET(self):
+            type(self).requests += 1
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            for _ in range(10):
+                self.wfile.write(b"x" * 100)
+                self.wfile.flush()
+                time.sleep(self.delay)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", Handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_async_api(cacher, slow_server, monkeypatch):
+    import asyncio
+
+    base, handler = slow_server
+    monkeypatch.setattr(cacher, "CHUNK_SIZE", 100)
+
+    async def main():
+        ids = await asyncio.gather(
+            *[cacher.acache("webTarget", url=f"{base}/{i}.bin") for i in range(5)]
+        )
+        assert len(set(ids)) == 5
+        assert (await cacher.aquery(f"{base}/3.bin")) is cacher.CACHE[ids[3]]
+        assert await cacher.acheck(ids[0]) == 0
+
+        # cancelling discards the in-flight download and the new item
+        handler.delay = 0.2
+        task = asyncio.create_task(cacher.acache("webTarget", url=f"{base}/slow.bin"))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await cacher.aclose()
+        return ids
+
+    ids = asyncio.run(main())
+    for i, id in enumerate(ids):
+        assert os.path.getsize(os.path.join(cacher.get_path(id), f"{i}.bin")) == 1000
+    assert cacher.query(f"{base}/slow.bin") is None
+    live = [name for name in os.listdir(cacher.CACHE_DIR) if not name.startswith(".")]
+    assert sorted(live) == sorted(ids)
+    assert os.listdir(os.path.join(cacher.CACHE_DIR, ".staging")) == []
+
+
+def test_single_flight_renewal(cacher, slow_server, tmp_path):
+    import subprocess
+    import sys
+
+    base, handler = slow_server
+    id = cacher.cache("webTarget", url=f"{base}/data.bin")
+    handler.delay = 0.05
+    handler.requests = 0
+
+    script = (
+        "import sys; from src.z2u4.cacher.core import Cacher; "
+        "Cacher.configure(sys.argv[1]); Cacher.check(sys.argv[2], force=True)"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    procs = [
+        subprocess.Popen([sys.executable, "-c", script, cacher.USRPATH, id], cwd=root)
+        for _ in range(3)
+    ]
+    assert [p.wait(timeout=30) for p in procs] == [0, 0, 0]
+    # one process downloaded, the others waited and reused its result
+    assert handler.requests == 1
+    cacher.CACHE.reload(id)
+    assert os.path.getsize(os.path.join(cacher.get_path(id), "data.bin")) == 1000
+
+
+def test_renewal_is_written_before_the_lock_is_released(cacher, tmp_path):
+    from src.z2u4.cacher.store import open_store
+
+    source = tmp_path / "data.txt"
+    source.write_text("v1")
+    id = cacher.cache("localTarget", path=str(source))
+    source.write_text("v2")
+
+    with cacher.CACHE.batch():
+        cacher.renew(id)
+        # another process waiting on the item lock sees the renewal
+        other = open_store(cacher.USRPATH, cacher.CONFIG.get("backend", "sqlite"))
+        assert other[id]["lastChecked"] == cacher.CACHE[id]["lastChecked"]
+        other.close()
+
+
+def test_staged_generations(cacher, tmp_path, monkeypatch):
+    source = tmp_path / "data.txt"
+    source.write_text("v1")
+    cacher.CONFIG["keepGenerations"] = 1
+    id = cacher.cache("localTarget", path=str(source))
+    path = cacher.get_path(id)
+    assert os.path.islink(path)
+
+    # an unchanged source is not even staged
+    def fail(*args):
+        raise AssertionError("seeded an unchanged item")
+
+    monkeypatch.setattr(cacher.GENERATIONS, "seed", fail)
+    cacher.check(id, force=True)
+    monkeypatch.undo()
+
+    # a failed renewal leaves the live generation untouched, but keeps the
+    # part files of its downloads
+    source.write_text("v2")
+    partial = cacher._partial_path(id)
+
+    def broken(id, item, stage):
+        os.makedirs(partial)
+        with open(os.path.join(partial, ".part-data"), "w") as f:
+            f.write("partial")
+        with open(os.path.join(stage, "data.txt"), "w") as f:
+            f.write("partial")
+        raise IOError("connection lost")
+
+    monkeypatch.setattr(cacher, "renew_localTarget", broken)
+    with pytest.raises(IOError):
+        cacher.check(id, force=True)
+    monkeypatch.undo()
+    with open(os.path.join(path, "data.txt")) as f:
+        assert f.read() == "v1"
+    assert os.listdir(os.path.join(cacher.CACHE_DIR, ".staging")) == []
+    assert os.listdir(partial) == [".part-data"]
+    shutil.rmtree(partial)
+
+    # readers holding the old generation keep seeing it after the swap
+    old = os.path.realpath(path)
+    cacher.check(id, force=True)
+    with open(os.path.join(path, "data.txt")) as f:
+        assert f.read() == "v2"
+    with open(os.path.join(old, "data.txt")) as f:
+        assert f.read() == "v1"
+
+    assert cacher.rollback(id) == 1
+    with open(os.path.join(path, "data.txt")) as f:
+        assert f.read() == "v1"
+
+    # only keepGenerations previous generations are kept
+    for content in ["v3", "v4"]:
+        source.write_text(content)
+        cacher.check(id, force=True)
+    assert len(cacher.GENERATIONS.list(id)) == 2
+
+    cacher.remove(id)
+    assert not os.path.lexists(path)
+    assert not os.path.exists(cacher.GENERATIONS.gens_path(id))
+
+
+def test_local_directory_target(cacher, tmp_path):
+    source = tmp_path / "tree"
+    (source / "sub").mkdir(parents=True)
+    (source / "a.txt").write_text("a")
+    (source / "sub" / "b.txt").write_text("b")
+
+    id = cacher.cache("localTarget", path=str(source))
+    path = cacher.get_path(id)
+    assert sorted(os.listdir(path)) == ["a.txt", "sub"]
+    generation = cacher.GENERATIONS.current(id)
+
+    # nothing changed, the live generation is kept
+    cacher.check(id, force=True)
+    assert cacher.GENERATIONS.current(id) == generation
+
+    (source / "sub" / "b.txt").unlink()
+    cacher.check(id, force=True)
+    assert os.listdir(os.path.join(path, "sub")) == []
+    assert cacher.GENERATIONS.current(id) == generation + 1
+
+
+def test_compressed_item(cacher, tmp_path, monkeypatch):
+    from src.z2u4.cacher import archive
+
+    source = tmp_path / "tree"
+    (source / "sub").mkdir(parents=True)
+    (source / "a.txt").write_text("a" * 1000)
+    (source / "sub" / "b.txt").write_text("b")
+    cacher.CONFIG["compress"] = True
+
+    id = cacher.cache("localTarget", path=str(source))
+    assert os.listdir(cacher.get_path(id)) == [".cacher.zip"]
+    assert cacher.CACHE[id]["size"] < 1000
+    with cacher.open_member(id, "sub/b.txt") as f:
+        assert f.read() == b"b"
+
+    # single members are extracted on demand
+    member = cacher.extract(id, "a.txt")
+    assert open(member).read() == "a" * 1000
+    root = os.path.dirname(member)
+    assert os.listdir(root) == ["a.txt"]
+    assert cacher.extract(id) == root
+    assert sorted(os.listdir(root)) == ["a.txt", "sub"]
+
+    # an unchanged source is compared to the manifest, nothing is unpacked
+    def fail(*args):
+        raise AssertionError("unpacked an unchanged item")
+
+    generation = cacher.GENERATIONS.current(id)
+    monkeypatch.setattr(archive.Archive, "extract", fail)
+    cacher.check(id, force=True)
+    monkeypatch.undo()
+    assert cacher.GENERATIONS.current(id) == generation
+
+    (source / "a.txt").write_text("c")
+    cacher.check(id, force=True)
+    assert open(cacher.extract(id, "a.txt")).read() == "c"
+    assert not os.path.exists(root)
+
+    cacher.set_compressed(id, False)
+    assert sorted(os.listdir(cacher.get_path(id))) == ["a.txt", "sub"]
+    assert cacher.extract(id, "a.txt") == os.path.join(cacher.get_path(id), "a.txt")
+
+
+def test_resolve(cacher, tmp_path):
+    source = tmp_path / "tree"
+    (source / "sub").mkdir(parents=True)
+    (source / "a.txt").write_text("a")
+    (source / "sub" / "b.txt").write_text("b")
+    (source / "sub" / "c.md").write_text("c")
+
+    id = cacher.cache("localTarget", path=str(source))
+    manifest = cacher.MANIFESTS.get(id)
+    assert sorted(manifest) == ["a.txt", "sub/b.txt", "sub/c.md"]
+    assert manifest["a.txt"]["size"] == 1
+
+    path = cacher.get_path(id)
+    assert cacher.resolve(id, "sub/b.txt") == [os.path.join(path, "sub", "b.txt")]
+    assert cacher.resolve(id, "b.txt") == [os.path.join(path, "sub", "b.txt")]
+    assert len(cacher.resolve(id, "*.txt")) == 2
+    assert cacher.resolve(id, "sub/*.md") == [os.path.join(path, "sub", "c.md")]
+    assert cacher.resolve(id, "missing") == []
+    assert cacher.CACHE[id]["hits"] == 5
+
+    # the manifest follows renewals
+    (source / "d.txt").write_text("d")
+    cacher.check(id, force=True)
+    assert cacher.resolve(id, "d.txt") == [os.path.join(path, "d.txt")]
+
+    # items cached before manifests existed get one built on first lookup
+    cacher.MANIFESTS.delete(id)
+    assert len(cacher.resolve(id, "*.txt")) == 3
+    assert cacher.MANIFESTS.get(id) is not None
+
+
+def test_verify(cacher, tmp_path):
+    source = tmp_path / "tree"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    (source / "b.txt").write_text("b")
+    id = cacher.cache("localTarget", path=str(source))
+    assert cacher.verify(workers=2) == {id: {"missing": [], "extra": [], "modified": []}}
+
+    path = cacher.get_path(id)
+    os.remove(os.path.join(path, "a.txt"))
+    with open(os.path.join(path, "b.txt"), "w") as f:
+        f.write("x")
+    with open(os.path.join(path, "c.txt"), "w") as f:
+        f.write("c")
+    report = cacher.verify([id], workers=1)[id]
+    assert report == {"missing": ["a.txt"], "extra": ["c.txt"], "modified": ["b.txt"]}
+
+    cacher.verify([id], repair=True)
+    assert sorted(os.listdir(cacher.get_path(id))) == ["a.txt", "b.txt"]
+    assert cacher.verify([id], workers=1)[id]["modified"] == []
+
+
+def test_blob_refs_follow_generations(cacher, tmp_path):
+    source = tmp_path / "data.txt"
+    source.write_text("v1")
+    cacher.CONFIG["blobs"] = "symlink"
+    cacher.CONFIG["keepGenerations"] = 1
+    cacher.configure(cacher.USRPATH)
+
+    id = cacher.cache("localTarget", path=str(source))
+    source.write_text("v2")
+    cacher.check(id, force=True)
+    assert sorted(cacher.BLOBS.items[id]) == ["1", "2"]
+
+    # the kept generation still has its blob
+    cacher.rollback(id)
+    with open(os.path.join(cacher.get_path(id), "data.txt")) as f:
+        assert f.read() == "v1"
+    assert cacher.verify([id], workers=1)[id] == {"missing": [], "extra": [], "modified": []}
+
+    # blobs go with the pruned generation
+    old = cacher.BLOBS.items[id]["1"]["data.txt"]
+    source.write_text("v3")
+    cacher.check(id, force=True)
+    source.write_text("v4")
+    cacher.check(id, force=True)
+    assert sorted(cacher.BLOBS.items[id]) == ["3", "4"]
+    assert not os.path.exists(cacher.BLOBS.blob_path(old))
+
+    # a dangling link is reported instead of vanishing from the manifest
+    os.remove(cacher.BLOBS.blob_path(cacher.BLOBS.items[id]["4"]["data.txt"]))
+    cacher.MANIFESTS.delete(id)
+    assert cacher.manifest(id)["data.txt"]["sha256"] is None
+    assert cacher.verify([id], workers=1)[id]["missing"] == ["data.txt"]
@@ -0,0 +1,185 @@
+import hashlib
+import http.server
+import os
+import threading
+
+import pytest
+from src.z2u4.cacher.download import adownload, download, download_segmented
+from src.z2u4.cacher.transport import OfflineError, Transport
+
+
+BODY = b"hello world\n" * 100
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+    ports = []
+    # number of upcoming responses to cut off halfway through the body
+    interrupt = 0
+    # answer 304 whatever the request, like a misbehaving proxy
+    notModified = False
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        self.ports.append(self.client_address[1])
+        if _Handler.notModified or self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start, end = 0, len(BODY) - 1
+        range_ = self.headers.get("Range")
+        if range_ and self.headers.get("If-Range", ETAG) == ETAG:
+            first, _, last = range_[len("bytes=") :].partition("-")
+            start, end = int(first), int(last or end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(BODY)}")
+        else:
+            self.send_response(200)
+        body = BODY[start : end + 1]
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if _Handler.interrupt:
+            _Handler.interrupt -= 1
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.requests = []
+    _Handler.ports = []
+    _Handler.interrupt = 0
+    _Handler.notModified = False
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_conditional_revalidation(server, tmp_path):
+    url = f"{server}/files/data.txt"
+
+    first = download(url, str(tmp_path))
+    assert first["status"] == 200
+    assert first["path"] == os.path.join(str(tmp_path), "data.txt")
+    assert first["validators"]["etag"] == ETAG
+    assert first["validators"]["lastModified"] == LAST_MODIFIED
+    assert first["validators"]["contentLength"] == len(BODY)
+    mtime = os.stat(first["path"]).st_mtime_ns
+
+    second = download(url, str(tmp_path), validators=first["validators"])
+    assert second["notModified"]
+    assert second["validators"] == first["validators"]
+    assert _Handler.requests[-1]["If-None-Match"] == ETAG
+    assert _Handler.requests[-1]["If-Modified-Since"] == LAST_MODIFIED
+    assert os.stat(first["path"]).st_mtime_ns == mtime
+
+    # a missing file forces a full download even with validators
+    os.remove(first["path"])
+    third = download(url, str(tmp_path), validators=first["validators"])
+    assert third["status"] == 200
+    assert "If-None-Match" not in _Handler.requests[-1]
+    with open(third["path"], "rb") as f:
+        assert f.read() == BODY
+
+    # a 304 is not taken as a hit when no conditional header was sent
+    _Handler.notModified = True
+    os.remove(third["path"])
+    with pytest.raises(IOError):
+        download(url, str(tmp_path), validators={"etag": ETAG})
+    with pytest.raises(IOError):
+        download(url, str(tmp_path), validators=first["validators"])
+
+
+def test_resume_and_checksum(server, tmp_path):
+    url = f"{server}/data.bin"
+    digest = hashlib.sha256(BODY).hexdigest()
+
+    _Handler.interrupt = 1
+    res = download(url, str(tmp_path), chunk_size=64, checksum=f"sha256:{digest}")
+    assert res["validators"]["contentLength"] == len(BODY)
+    assert len(_Handler.requests) == 2
+    assert _Handler.requests[-1]["Range"] != "bytes=0-"
+    assert _Handler.requests[-1]["If-Range"] == ETAG
+    with open(res["path"], "rb") as f:
+        assert f.read() == BODY
+    # only the final file is left behind
+    assert os.listdir(str(tmp_path)) == ["data.bin"]
+
+    with pytest.raises(ValueError):
+        download(url, str(tmp_path / "bad"), checksum="sha256:" + "0" * 64)
+    assert os.listdir(str(tmp_path / "bad")) == []
+
+
+def test_async_download(server, tmp_path):
+    httpx = pytest.importorskip("httpx")
+    import asyncio
+
+    url = f"{server}/data.bin"
+    dest = str(tmp_path / "dest")
+    parts = str(tmp_path / "parts")
+
+    async def main():
+        async with httpx.AsyncClient() as client:
+            # an interrupted transfer keeps its part file for the next call
+            _Handler.interrupt = 1
+            with pytest.raises(httpx.HTTPError):
+                await adownload(url, dest, client=client, chunk_size=64, part_dir=parts)
+            assert len(os.listdir(parts)) == 2
+            first = await adownload(url, dest, client=client, part_dir=parts)
+            second = await adownload(
+                url, dest, validators=first["validators"], client=client, part_dir=parts
+            )
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first["status"] == 206
+    assert _Handler.requests[1]["If-Range"] == ETAG
+    with open(first["path"], "rb") as f:
+        assert f.read() == BODY
+    assert os.listdir(parts) == []
+    assert second["notModified"]
+    assert _Handler.requests[-1]["If-None-Match"] == ETAG
+
+
+def test_segmented_download(server, tmp_path):
+    url = f"{server}/big.bin"
+    digest = hashlib.sha256(BODY).hexdigest()
+
+    path = download_segmented(
+        url, str(tmp_path), "big.bin", len(BODY), segments=3, checksum=f"sha256:{digest}"
+    )
+    ranges = sorted(r["Range"] for r in _Handler.requests)
+    assert ranges == ["bytes=0-399", "bytes=400-799", "bytes=800-1199"]
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+    assert os.listdir(str(tmp_path)) == ["big.bin"]
+
+
+def test_transport_reuses_connections(server, tmp_path):
+    transport = Transport(perHost=1)
+    for name in ["a.txt", "b.txt", "c.txt"]:
+        download(f"{server}/{name}", str(tmp_path), session=transport)
+    # one kept-alive connection served every download
+    assert len(set(_Handler.ports)) == 1
+    assert sorted(os.listdir(str(tmp_path))) == ["a.txt", "b.txt", "c.txt"]
+
+    transport.offline = True
+    with pytest.raises(OfflineError):
+        download(f"{server}/d.txt", str(tmp_path), session=transport)
+    assert len(_Handler.requests) == 3
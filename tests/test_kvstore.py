@@ -0,0 +1,117 @@
+import pytest
+import src.z2u4.kvstore as kv
+
+
+class FakeMasscode:
+    def __init__(self):
+        self.db = {}
+        self.calls = []
+
+    def snippets(self, params={}):
+        self.calls.append(("snippets", dict(params)))
+        return [
+            dict(s)
+            for s in self.db.values()
+            if "name" not in params or s["name"] == params["name"]
+        ]
+
+    def create_snippet(self, **kwargs):
+        self.calls.append(("create", kwargs["name"]))
+        snippet = dict(kwargs, id=f"id{len(self.db)}", isDeleted=False)
+        self.db[snippet["id"]] = snippet
+        return dict(snippet)
+
+    def update_snippet(self, snippet):
+        self.calls.append(("update", snippet["name"]))
+        self.db[snippet["id"]] = dict(snippet)
+        return dict(snippet)
+
+    def delete_snippet(self, id):
+        self.calls.append(("delete", self.db.pop(id)["name"]))
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    fake = FakeMasscode()
+    monkeypatch.setattr(kv, "MasscodeApi", fake)
+    monkeypatch.setattr(kv, "USRPATH", str(tmp_path))
+    return fake
+
+
+def test_read_through_cache(api):
+    store = kv._Kvstore(ttl=None)
+    store["a"] = "1"
+    assert api.calls == [("snippets", {"name": "a"}), ("create", "a")]
+
+    # served from the cache, within and across instances
+    assert store["a"] == "1"
+    assert kv._Kvstore(ttl=None)["a"] == "1"
+    assert len(api.calls) == 2
+
+    # writes go through the cached snippet
+    store["a"] = "2"
+    assert api.calls[-1] == ("update", "a")
+    assert kv._Kvstore(ttl=None)["a"] == "2"
+
+    # a fresh complete listing answers misses too
+    api.calls.clear()
+    assert store.prefetch() == 1
+    assert store["missing"] is None
+    assert api.calls == [("snippets", {})]
+
+    expired = kv._Kvstore(ttl=0)
+    assert expired["a"] == "2"
+    assert api.calls[-1] == ("snippets", {"name": "a"})
+
+
+def test_batch_operations(api):
+    store = kv._Kvstore(ttl=None)
+    store.set_many({"a": "1", "b": "2"})
+    assert api.calls == [("snippets", {}), ("create", "a"), ("create", "b")]
+
+    api.calls.clear()
+    assert store.get_many(["a", "b", "c"]) == {"a": "1", "b": "2", "c": None}
+    assert store.items() == {"a": "1", "b": "2"}
+    assert sorted(store.keys()) == ["a", "b"]
+    assert api.calls == []
+
+    # unchanged values are not written again
+    store.set_many({"a": "1", "b": "3"})
+    assert api.calls == [("snippets", {}), ("update", "b")]
+
+    assert store.delete_many(["a", "c"]) == ["a"]
+    assert store.items() == {"b": "3"}
+    store.clear()
+    assert api.db == {}
+
+
+def test_writes_start_from_masscode(api):
+    store = kv._Kvstore(ttl=None)
+    store.set_many({"a": "1", "b": "2"})
+    a = next(s for s in api.db.values() if s["name"] == "a")
+
+    # edits made in masscode survive a write through a stale cache
+    a["content"] = a["content"] + [{"language": "markdown", "value": "notes", "label": "doc"}]
+    store["a"] = "2"
+    assert [f["value"] for f in api.db[a["id"]]["content"]] == ["2", "notes"]
+
+    # a snippet deleted in masscode is created again instead of failing
+    api.delete_snippet(next(s["id"] for s in api.db.values() if s["name"] == "b"))
+    store.set_many({"b": "3", "c": "4"})
+    assert store.get_many(["b", "c"]) == {"b": "3", "c": "4"}
+
+    # a failing key does not keep the others out of masscode and the cache
+    update = api.update_snippet
+
+    def failing(snippet):
+        if snippet["name"] == "b":
+            raise IOError("conflict")
+        return update(snippet)
+
+    api.update_snippet = failing
+    with pytest.raises(kv.PartialWriteError) as e:
+        store.set_many({"a": "5", "b": "5"})
+    assert list(e.value.failed) == ["b"]
+    api.calls.clear()
+    assert store.get_many(["a", "b"]) == {"a": "5", "b": "3"}
+    assert api.calls == []
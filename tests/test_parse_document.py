@@ -27,3 +27,17 @@ def test_parse_document():
     expected = "Hello, !"
     with pytest.raises(ValueError):
         parse_document(document, kvstore)
+
+
+def test_parse_document_comments_and_duplicates():
+    class Store(dict):
+        lookups = 0
+
+        def get(self, key, default=None):
+            Store.lookups += 1
+            return super().get(key, default)
+
+    store = Store(name="Alice")
+    document = "//<$@name>\nx #<$@name>\n#<$@name> <$@name>"
+    assert parse_document(document, store) == "Alice\nx #Alice\nAlice Alice"
+    assert Store.lookups == 1
@@ -0,0 +1,120 @@
+import json
+import os
+
+import pytest
+from src.z2u4.cacher.store import JsonStore, SqliteStore, open_store
+
+
+def _item(type_, **meta):
+    return {"type": type_, "lastChecked": 0, "checkInterval": 60, "meta": meta}
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_store(tmp_path, backend):
+    root = str(tmp_path)
+    store = open_store(root, backend)
+    store["a"] = _item("webTarget", url="https://example.com/a")
+    store["b"] = _item("gitRepo", url="https://github.com/o/r.git", repo="r")
+
+    assert store.index.find_value("r") == "b"
+    assert store.index.find_params("webTarget", {"url": "https://example.com/a"}) == "a"
+    assert store.index.of_type("gitRepo") == ["b"]
+
+    # in place updates are deferred until the batch exits
+    with store.batch():
+        store["a"]["lastChecked"] = 10
+        store.save("a")
+        assert open_store(root, backend)["a"]["lastChecked"] == 0
+    assert open_store(root, backend)["a"]["lastChecked"] == 10
+
+    del store["b"]
+    reopened = open_store(root, backend)
+    assert list(reopened) == ["a"]
+    assert reopened.index.find_value("r") is None
+
+    # sizes are totalled by the writes, across stores too
+    store["b"] = dict(_item("webTarget", url="https://example.com/b"), size=5)
+    store["a"]["size"] = 10
+    store.save("a")
+    assert store.total_size() == 15
+    other = open_store(root, backend)
+    del other["b"]
+    assert store.total_size() == 10
+
+    store.clear()
+    assert len(open_store(root, backend)) == 0
+    assert store.total_size() == 0
+
+
+def test_sqlite_migration(tmp_path):
+    root = str(tmp_path)
+    legacy = {"a": _item("webTarget", url="https://example.com/a")}
+    with open(os.path.join(root, "cache.json"), "w") as f:
+        json.dump(legacy, f)
+
+    store = open_store(root)
+    assert isinstance(store, SqliteStore)
+    assert dict(store) == legacy
+    assert store.index.find_value("https://example.com/a") == "a"
+    assert not os.path.exists(os.path.join(root, "cache.json"))
+    store["b"] = _item("webTarget", url="https://example.com/b")
+    store.close()
+
+    # switching back carries the items over instead of starting empty
+    reopened = open_store(root, "json")
+    assert isinstance(reopened, JsonStore)
+    assert sorted(reopened) == ["a", "b"]
+    assert reopened["a"] == legacy["a"]
+    assert reopened.index.find_value("https://example.com/b") == "b"
+    assert not os.path.exists(os.path.join(root, "cache.db"))
+    assert sorted(open_store(root)) == ["a", "b"]
+
+
+def test_sqlite_size_column_upgrade(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id TEXT PRIMARY KEY, type TEXT NOT NULL, data TEXT NOT NULL)")
+    conn.execute(
+        "INSERT INTO items VALUES (?, ?, ?)",
+        ("a", "webTarget", json.dumps(dict(_item("webTarget", url="u"), size=7))),
+    )
+    conn.commit()
+    conn.close()
+
+    store = SqliteStore(path)
+    assert store.total_size() == 7
+    store["a"]["size"] = 3
+    store.save("a")
+    assert store.total_size() == 3
+
+
+def test_sqlite_store_forgets_removed_items(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = SqliteStore(path)
+    second = SqliteStore(path)
+    first["a"] = _item("webTarget", url="https://example.com/a")
+    assert first["a"]["type"] == "webTarget"
+
+    del second["a"]
+    assert "a" not in first
+    with pytest.raises(KeyError):
+        first["a"]
+
+
+def test_json_store_merges_concurrent_writers(tmp_path):
+    root = str(tmp_path)
+    first = open_store(root, "json")
+    second = open_store(root, "json")
+    assert len(first) == len(second) == 0
+
+    first["a"] = _item("webTarget", url="https://example.com/a")
+    second["b"] = _item("webTarget", url="https://example.com/b")
+    assert sorted(open_store(root, "json")) == ["a", "b"]
+    # the other writer's items are picked up on write
+    assert "a" in second
+
+    second["a"]["lastChecked"] = 5
+    second.save("a")
+    assert first.reload("a")["lastChecked"] == 5
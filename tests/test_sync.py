@@ -0,0 +1,43 @@
+import os
+
+from src.z2u4.cacher.sync import sync_tree
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_sync_tree(tmp_path):
+    src = str(tmp_path / "src")
+    dst = str(tmp_path / "dst")
+    _write(os.path.join(src, "a.txt"), "a")
+    _write(os.path.join(src, "sub", "b.txt"), "b")
+    _write(os.path.join(src, "old", "c.txt"), "c")
+
+    assert sync_tree(src, dst) == {"copied": 3, "deleted": 0, "unchanged": 0}
+    assert sync_tree(src, dst) == {"copied": 0, "deleted": 0, "unchanged": 3}
+
+    _write(os.path.join(src, "sub", "b.txt"), "b2")
+    os.utime(os.path.join(src, "sub", "b.txt"), ns=(1, 1))
+    _write(os.path.join(src, "new.txt"), "new")
+    os.remove(os.path.join(src, "old", "c.txt"))
+    os.rmdir(os.path.join(src, "old"))
+
+    # c.txt and its directory are deleted
+    assert sync_tree(src, dst) == {"copied": 2, "deleted": 2, "unchanged": 1}
+    assert sorted(os.listdir(dst)) == ["a.txt", "new.txt", "sub"]
+    with open(os.path.join(dst, "sub", "b.txt")) as f:
+        assert f.read() == "b2"
+
+    # same size and mtime is only caught by hashing
+    _write(os.path.join(src, "a.txt"), "A")
+    mtime = os.stat(os.path.join(dst, "a.txt")).st_mtime_ns
+    os.utime(os.path.join(src, "a.txt"), ns=(mtime, mtime))
+    assert sync_tree(src, dst)["copied"] == 0
+    assert sync_tree(src, dst, useHash=True)["copied"] == 1
+
+    # a single file is mirrored under its name
+    assert sync_tree(os.path.join(src, "a.txt"), dst)["deleted"] == 3
+    assert os.listdir(dst) == ["a.txt"]
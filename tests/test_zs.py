@@ -0,0 +1,212 @@
+import os
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+SHELL = """
+import click
+
+with open({log!r}, "a") as f:
+    f.write("{name}\\n")
+
+
+@click.group(help={help!r})
+def cli():
+    pass
+
+
+@cli.command()
+def hello():
+    click.echo("hello from {name}")
+"""
+
+
+@pytest.fixture
+def zs(tmp_path, monkeypatch):
+    # shells import z2u4 as an installed package
+    monkeypatch.syspath_prepend(SRC)
+    import z2u4.zs as zs
+    from z2u4.cacher.core import Cacher
+    from z2u4.zs import selfResolve
+
+    Cacher.configure(str(tmp_path / "cacher"))
+    config = {"shells": {}, "aliases": {}}
+    monkeypatch.setattr(selfResolve, "get_config", lambda: config)
+    monkeypatch.setattr(selfResolve, "_MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    selfResolve.load_manifest.cache_clear()
+
+    log = tmp_path / "imports.log"
+    log.write_text("")
+
+    def add_shell(name, help):
+        id = f"shell-{name}"
+        root = Cacher.get_path(id)
+        os.makedirs(root, exist_ok=True)
+        cli = os.path.join(root, "cli.py")
+        with open(cli, "w") as f:
+            f.write(SHELL.format(log=str(log), name=name, help=help))
+        config["shells"][name] = id
+        return cli
+
+    yield zs, config, add_shell, lambda: log.read_text().split()
+
+    selfResolve.load_manifest.cache_clear()
+    Cacher.configure()
+    for name in [m for m in sys.modules if m.startswith("zs_shells.")]:
+        del sys.modules[name]
+
+
+def test_run_imports_only_the_invoked_shell(zs, monkeypatch):
+    from z2u4.zs import selfResolve
+
+    zs, config, add_shell, imported = zs
+    alpha = add_shell("alpha", "Alpha tools")
+    add_shell("beta", "Beta tools")
+    config["aliases"]["beta"] = "b"
+    runner = CliRunner()
+    scans = []
+    shell_roots = selfResolve.shell_roots
+    monkeypatch.setattr(selfResolve, "shell_roots", lambda: scans.append(1) or shell_roots())
+
+    # help is read from the sources, nothing is imported
+    res = runner.invoke(zs.cli, ["run", "--help"])
+    assert res.exit_code == 0, res.output
+    assert "Alpha tools" in res.output
+    assert "Beta tools" in res.output
+    assert imported() == []
+    # the shell roots are gathered once for all shells
+    assert len(scans) == 1
+
+    res = runner.invoke(zs.cli, ["run", "alpha", "hello"])
+    assert res.output == "hello from alpha\n"
+    assert imported() == ["alpha"]
+
+    res = runner.invoke(zs.cli, ["run", "b", "hello"])
+    assert res.output == "hello from beta\n"
+    assert imported() == ["alpha", "beta"]
+
+    # an edited shell gets a new manifest entry
+    with open(alpha, "w") as f:
+        f.write(SHELL.format(log="/dev/null", name="alpha", help="Alpha tools v2"))
+    mtime = os.path.getmtime(alpha) + 10
+    os.utime(alpha, (mtime, mtime))
+    res = runner.invoke(zs.cli, ["run", "--help"])
+    assert "Alpha tools v2" in res.output
+    assert imported() == ["alpha", "beta"]
+
+
+def test_poetry_requirement(tmp_path):
+    from src.z2u4.zs.selfResolve import _poetry_requirement as req
+
+    assert req("python", "^3.8") is None
+    assert req("click", "*") == "click"
+    assert req("click", "^8.1") == "click>=8.1,<9"
+    assert req("zero", "^0.2.3") == "zero>=0.2.3,<0.3"
+    assert req("toml", "~0.10") == "toml>=0.10,<0.11"
+    assert req("pinned", "1.2.3") == "pinned==1.2.3"
+    assert req("ranged", ">=1,<2") == "ranged>=1,<2"
+    assert req("extra", {"version": "^1.0", "optional": True}) is None
+    assert req("old", {"version": "^1.0", "python": "<3"}) is None
+    assert req("new", {"version": "^1.0", "python": "^3.8 || ^2.7"}) == "new>=1.0,<2"
+    assert (
+        req("httpx", {"version": "^0.26", "extras": ["http2", "socks"]})
+        == "httpx[http2,socks]>=0.26,<0.27"
+    )
+    assert req("multi", [{"version": "^1.0", "python": "<3"}, {"version": "^2.0"}]) == (
+        "multi>=2.0,<3"
+    )
+    assert req("none", [{"version": "^1.0", "python": "<3"}]) is None
+    assert (
+        req("lib", {"git": "https://example.com/lib.git", "tag": "v1"})
+        == "lib @ git+https://example.com/lib.git@v1"
+    )
+    assert req("wheel", {"url": "https://example.com/w.whl"}) == (
+        "wheel @ https://example.com/w.whl"
+    )
+    path = req("local", {"path": "../local", "develop": True}, str(tmp_path / "shell"))
+    assert path == f"local @ {(tmp_path / 'local').as_uri()}"
+    assert req("odd", {"source": "private"}) is None
+
+
+def test_read_requirements(tmp_path):
+    from src.z2u4.zs.selfResolve import read_requirements
+
+    poetry = tmp_path / "poetry"
+    poetry.mkdir()
+    (poetry / "pyproject.toml").write_text(
+        "[tool.poetry.dependencies]\n"
+        'python = "^3.8"\n'
+        'click = "^8.0"\n'
+        'rich = { version = "*", optional = true }\n'
+    )
+    assert read_requirements(str(poetry)) == ["click>=8.0,<9"]
+
+    pep621 = tmp_path / "pep621"
+    pep621.mkdir()
+    (pep621 / "pyproject.toml").write_text('[project]\ndependencies = ["toml>=0.10"]\n')
+    assert read_requirements(str(pep621)) == ["toml>=0.10"]
+
+    plain = tmp_path / "plain"
+    plain.mkdir()
+    (plain / "requirements.txt").write_text("# tools\nclick  # cli\n\nrequests>=2\n")
+    assert read_requirements(str(plain)) == ["click", "requests>=2"]
+    assert read_requirements(str(tmp_path)) == []
+
+
+def test_is_satisfied():
+    from src.z2u4.zs.selfResolve import is_satisfied
+
+    assert is_satisfied("click>=1")
+    assert not is_satisfied("click<1")
+    assert not is_satisfied("surely-not-an-installed-package")
+    # requirements for other interpreters do not need installing
+    assert is_satisfied("surely-not-an-installed-package; python_version < '3'")
+    assert not is_satisfied("-e ./local")
+
+
+def test_install_dependencies_per_interpreter(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(SRC)
+    from z2u4.zs import selfResolve
+
+    calls = []
+    monkeypatch.setattr(selfResolve, "_DEPS_STATE_PATH", str(tmp_path / "deps.json"))
+    monkeypatch.setattr(selfResolve.subprocess, "run", lambda args, check: calls.append(args))
+    (tmp_path / "requirements.txt").write_text("click\nsurely-not-an-installed-package\n")
+
+    selfResolve.install_dependencies(str(tmp_path))
+    assert calls == [[sys.executable, "-m", "pip", "install", "surely-not-an-installed-package"]]
+    selfResolve.install_dependencies(str(tmp_path))
+    assert len(calls) == 1
+
+    # another interpreter has its own site-packages to fill
+    monkeypatch.setattr(sys, "executable", "/other/python")
+    selfResolve.install_dependencies(str(tmp_path))
+    assert calls[-1][0] == "/other/python"
+
+
+def test_changed_shell_installs_its_dependencies(zs, monkeypatch):
+    from z2u4.zs import selfResolve
+
+    zs, config, add_shell, imported = zs
+    cli = add_shell("alpha", "Alpha tools")
+    installs = []
+    monkeypatch.setattr(selfResolve, "install_dependencies", installs.append)
+
+    # listing help never installs
+    res = CliRunner().invoke(zs.cli, ["run", "--help"])
+    assert res.exit_code == 0, res.output
+    assert installs == []
+
+    selfResolve.import_shell("alpha")
+    selfResolve.import_shell("alpha")
+    assert installs == [os.path.dirname(cli)]
+
+    mtime = os.path.getmtime(cli) + 10
+    os.utime(cli, (mtime, mtime))
+    selfResolve.resolve_shell("alpha")
+    assert len(installs) == 1
+    selfResolve.import_shell("alpha")
+    assert len(installs) == 2